@@ -3,11 +3,25 @@ Implementation of nice effect
 Inspired from https://github.com/the-real-tokai/macuahuitl/blob/master/comitl.py
 """
 
+# region Imports
+import os
+import sys
+import math
 from enum import Enum
 from random import seed as set_seed, uniform, randint, choice
 from argparse import ArgumentParser
 from colorsys import hls_to_rgb, rgb_to_hls
-from SVGVideoMaker import EllipseArc, Ellipse, Point2D, SVG, Video
+from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
+from contextlib import suppress
+
+import numpy as np
+
+from SVGVideoMaker import EllipseArc, Ellipse, Point2D, SVG, Video, AnimationType
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared helpers at the root
+from raster import parse_color
+# endregion Imports
 
 __author__ = "Yann Zavattero"
 __version__ = "1"
@@ -21,7 +35,7 @@ class AnimGenerator(Enum):
 
 class HypnoticEllipse:
 	def __init__(self, fps, rx, ry, om, stroke, linecaps, gap, nb_ellipse, sens,
-	             duration, bg, color, gdt, type, name, ext, seed=None):
+	             duration, bg, color, gdt, type, name, ext, seed=None, backend="svg"):
 		self.svg = SVG(background_color=bg)
 
 		colored = "128,128,128" if gdt else color # Grey
@@ -53,6 +67,7 @@ class HypnoticEllipse:
 		self.video = Video(self.svg, width=1500, height=1500, fps=fps)
 		self.name = name
 		self.ext = ext
+		self.backend = backend
 
 	def set_anim_generator(self, anim_type):
 		if anim_type == AnimGenerator.CHAOS.value:
@@ -147,7 +162,279 @@ class HypnoticEllipse:
 			               sens * (360 * nb_turn_to_do) / self.nb_ellipse)
 
 	def make_animation(self):
-		self.video.save_movie(name=self.name, ext=self.ext)
+		if self.backend == "sprite":
+			SpriteRenderer(self.svg, self.fps).save_movie(name=self.name, ext=self.ext)
+		else:
+			self.video.save_movie(name=self.name, ext=self.ext)
+
+def rotations(element, nb_frames):
+	# Angle of element at each frame, SVGVideoMaker spreads each rotation key linearly since the previous key
+	frames = np.arange(nb_frames + 1, dtype=np.float64)
+	angles = np.zeros(nb_frames + 1)
+	if element.animations:
+		previous = 0
+		for key, value in element.animations.anims[AnimationType.ROTATION].items():
+			angles += value * np.clip((frames - previous) / max(key - previous, 1), 0, 1)
+			previous = key
+	return angles
+
+def nearest_on_ellipse(x, y, a, b, iterations=3):
+	# Parameter u of the nearest point (a cos u, b sin u) of ellipse, newton steps from the scaled angle
+	# who is already the nearest point of circles
+	u = np.arctan2(y * a, x * b)
+	if a == b:
+		return u
+	for _ in range(iterations):
+		c, s = np.cos(u), np.sin(u)
+		g = (b * b - a * a) * s * c + a * x * s - b * y * c
+		dg = (b * b - a * a) * (c * c - s * s) + a * x * c + b * y * s
+		u -= np.clip(g / np.where(dg > 1e-9, dg, 1e-9), -0.5, 0.5)
+	return u
+
+def ellipse_coverage(x, y, a, b, half=None, start=None, end=None, caps=None):
+	# Anti aliased coverage in pixel of the stroke of ellipse, of its arc from start to end in degree,
+	# or of its inside when half is None
+	u = nearest_on_ellipse(x, y, a, b)
+	distance = np.hypot(x - a * np.cos(u), y - b * np.sin(u))
+	if half is None:
+		outside = (x / a) ** 2 + (y / b) ** 2 > 1
+		return np.clip(0.5 - np.where(outside, distance, -distance), 0, 1)
+
+	cover = np.clip(half + 0.5 - distance, 0, 1)
+	if start is None:
+		return cover
+	return arc_cut(x, y, a, b, half, np.degrees(-u), cover, start, end, caps)
+
+def arc_cut(x, y, a, b, half, theta, cover, start, end, caps):
+	# Stroke of ellipse kept from start to end, svg angles theta go anticlockwise on screen
+	inside = (theta - start) % 360 <= end - start
+	ends = [(-math.radians(start), -1), (-math.radians(end), 1)]
+	if caps == "round":
+		cover *= inside
+		for r, _ in ends:
+			cover = np.maximum(cover, np.clip(half + 0.5 - np.hypot(x - a * math.cos(r), y - b * math.sin(r)), 0, 1))
+		return cover
+
+	# Butt caps, the stroke is cut by the normal at its ends
+	cut, touched = inside.astype(np.float64), np.zeros(x.shape, dtype=bool)
+	for r, sens in ends:
+		px, py = a * math.cos(r), b * math.sin(r)
+		tx, ty = sens * a * math.sin(r), -sens * b * math.cos(r)
+		factor = np.clip(0.5 - ((x - px) * tx + (y - py) * ty) / math.hypot(tx, ty), 0, 1)
+		close = np.hypot(x - px, y - py) < half + 2
+		cut = np.where(close, np.where(touched, np.minimum(cut, factor), factor), cut)
+		touched |= close
+	return cover * cut
+
+class Sprite:
+	# Coverage of a shape in a polar strip around the origin, row j is at radius inner + j * step and column k
+	# at angle 2 pi k / n, columns are twice to turn without modulo. pixels of the ring the shape can cover
+	# are sorted by block of rows then column, runs are the columns of blocks where the strip isn't empty
+	__slots__ = ("strip", "color", "under", "lut", "crossed", "shifts", "inner", "outer", "n", "pixels", "cells",
+	             "starts", "runs")
+
+class SpriteRenderer:
+	# Frames of shapes who only rotate around the origin. Each shape is rasterized once in a polar strip,
+	# a frame shifts columns of strips by the rotation of shapes and only sets pixels of the shifted runs.
+	# Pixels are premultiplied rgba packed in uint32, outside of the view box is transparent like svg2png
+	STEP = 0.25  # pixel between rows
+	SPACING = 0.5  # pixel between columns on the outer row
+	BLOCK = 32  # rows by block
+	CHUNK = 1 << 18  # samples of a strip computed at once
+
+	def __init__(self, svg, fps=30):
+		self.fps = fps
+		self.width, self.height = (int(round(v)) for v in svg.svg_dimensions)
+		self.nb_frames = svg.get_nb_frames()
+
+		# Place of the view box like preserveAspectRatio xMidYMid meet
+		start, end = svg.start_vb.coordinates, svg.end_vb.coordinates
+		dw, dh = end[0] - start[0], end[1] - start[1]
+		self.scale = scale = min(self.width / dw, self.height / dh)
+		left, top = (self.width - dw * scale) / 2, (self.height - dh * scale) / 2
+		cx, cy = left - start[0] * scale, top - start[1] * scale
+
+		x = np.arange(self.width, dtype=np.float64) + 0.5 - cx
+		y = np.arange(self.height, dtype=np.float64) + 0.5 - cy
+		self.radius = np.hypot(x[None, :], y[:, None]).ravel()
+		self.angle = (np.arctan2(y[:, None], x[None, :]) % (2 * math.pi)).ravel()
+
+		self.base = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+		bg = svg.background_color
+		if bg and bg != "none":
+			self.base[int(round(top)):int(round(top + dh * scale)), int(round(left)):int(round(left + dw * scale))] = \
+				parse_color(bg) + (255,)
+
+		# Sprites who never move and don't cross a moving ring before them are drawn once on base
+		self.sprites, pixels = [], self.base.view(np.uint32).ravel()
+		for element in svg.group:
+			angles = rotations(element, self.nb_frames)
+			for sprite in self.rasterize(element):
+				sprite.shifts = np.rint(angles * sprite.n / 360).astype(np.int64) % sprite.n
+				crossed = any(not (s.outer < sprite.inner or sprite.outer < s.inner) for s in self.sprites)
+				if not sprite.shifts.any() and not crossed:
+					self.blend(pixels, sprite, 0)
+					continue
+				# On a ring of one color, pixels still of this color are read in a table by coverage
+				under = pixels[sprite.pixels]
+				if len(under) and (under == under[0]).all():
+					sprite.under, sprite.crossed = under[0], crossed
+					under = under[:1].view(np.uint8).astype(np.float32)
+					alpha = np.arange(256, dtype=np.float32)[:, None] / 255
+					sprite.lut = (under + (sprite.color - under) * alpha + 0.5).astype(np.uint8).view(np.uint32).ravel()
+				self.sprites.append(sprite)
+		self.opaque = (self.base[..., 3] == 255).all()
+
+	def rasterize(self, element):
+		style = element.style
+		if isinstance(element, EllipseArc):
+			(rx, ry), start, end = element.radius, element.sa, element.ea
+		elif isinstance(element, Ellipse):
+			rx, ry, start, end = element.rx, element.ry, None, None
+		else:
+			raise ValueError(f"{element} isn't supported by sprite renderer")
+		if any(element.get_center()):
+			raise ValueError(f"{element} isn't centered on the origin of rotation")
+
+		a, b = rx * self.scale, ry * self.scale
+		opacity = 1 if style.opacity is None else style.opacity
+		# Radius of ellipse by angle, distance to it is at least the radial gap times b / a
+		reach = max(a, b) / min(a, b)
+		edge = lambda angle, width: (a * b / np.hypot(b * np.cos(angle), a * np.sin(angle)), width * reach)
+		if start is None and style.fill_color not in (None, "none"):
+			yield self.sprite(style.fill_color, opacity, 0, max(a, b) + 1, lambda angle: edge(angle, 2),
+			                  lambda x, y: ellipse_coverage(x, y, a, b), inside=1)
+		if style.stroke_color not in (None, "none"):
+			half = (1 if style.stroke_width is None else style.stroke_width) * self.scale / 2
+			yield self.sprite(style.stroke_color, opacity, max(0, min(a, b) - half - 1), max(a, b) + half + 1,
+			                  lambda angle: edge(angle, half + 2),
+			                  lambda x, y: ellipse_coverage(x, y, a, b, half, start, end, style.stroke_linecaps))
+
+	def sprite(self, color, opacity, inner, outer, edge, coverage, inside=0):
+		# edge gives the radius of the border of shape by angle and a width around it, coverage is only
+		# computed there, inside is the coverage nearer the origin
+		sprite = Sprite()
+		sprite.color = np.array(parse_color(color) + (255,), dtype=np.float32)
+		sprite.under, sprite.lut, sprite.crossed = None, None, False
+		sprite.inner, sprite.outer = inner, outer
+		sprite.n = n = max(8, math.ceil(2 * math.pi * outer / self.SPACING))
+
+		# Strip sampled by rows at radius, the same coverage than svg shape as it's not rotated
+		nb_rows = math.ceil((outer - inner) / self.STEP) + 1
+		strip = np.empty((nb_rows, n), dtype=np.uint8)
+		angle = np.arange(n) * (2 * math.pi / n)
+		cos, sin = np.cos(angle), np.sin(angle)
+		border, width = edge(angle)
+		chunk = max(1, self.CHUNK // n)
+		for j in range(0, nb_rows, chunk):
+			radius = inner + np.arange(j, min(nb_rows, j + chunk))[:, None] * self.STEP
+			part = strip[j:j + len(radius)]
+			part[:] = np.where(radius < border - width, round(inside * opacity * 255), 0)
+			rows, columns = np.nonzero(np.abs(radius - border) <= width)
+			radius = radius[rows, 0]
+			part[rows, columns] = np.rint(coverage(radius * cos[columns], radius * sin[columns]) * opacity * 255)
+		sprite.strip = np.concatenate([strip, strip], axis=1).ravel()
+
+		# Pixels of ring by block and column, the cell of strip they read is shifted by n - shift
+		pixels = np.flatnonzero((self.radius >= inner) & (self.radius <= outer))
+		rows = np.rint((self.radius[pixels] - inner) / self.STEP).astype(np.int64)
+		columns = np.rint(self.angle[pixels] * (n / (2 * math.pi))).astype(np.int64) % n
+		keys = rows // self.BLOCK * n + columns
+		order = np.argsort(keys, kind="stable")
+		sprite.pixels = pixels[order]
+		sprite.cells = (rows * 2 * n + columns)[order]
+		nb_blocks = (nb_rows + self.BLOCK - 1) // self.BLOCK
+		sprite.starts = np.searchsorted(keys[order], np.arange(nb_blocks * n + 1))
+
+		# Runs of columns where a block of rows isn't empty
+		sprite.runs = []
+		for block in range(nb_blocks):
+			used = np.concatenate([[False], strip[block * self.BLOCK:(block + 1) * self.BLOCK].any(axis=0), [False]])
+			edges = np.flatnonzero(used[1:] != used[:-1])
+			sprite.runs.extend((block * n, k0, k1) for k0, k1 in zip(edges[::2].tolist(), edges[1::2].tolist()))
+		return sprite
+
+	@staticmethod
+	def select(sprite, shift):
+		# Ranges of sorted pixels who can be covered once the strip is turned by shift columns
+		n, starts, slices = sprite.n, sprite.starts, []
+		for key, k0, k1 in sprite.runs:
+			k0, k1 = k0 + shift, k1 + shift
+			if k1 <= n:
+				slices.append((starts[key + k0], starts[key + k1]))
+			elif k0 >= n:
+				slices.append((starts[key + k0 - n], starts[key + k1 - n]))
+			else:
+				slices.append((starts[key + k0], starts[key + n]))
+				slices.append((starts[key], starts[key + k1 - n]))
+		if len(slices) == 1:
+			(i, j), = slices
+			return sprite.pixels[i:j], sprite.cells[i:j]
+		return np.concatenate([sprite.pixels[i:j] for i, j in slices]), \
+		       np.concatenate([sprite.cells[i:j] for i, j in slices])
+
+	def blend(self, pixels, sprite, shift):
+		# Shape turned by shift columns over pixels, a flat uint32 view
+		indices, cells = self.select(sprite, shift)
+		alpha = sprite.strip[cells + (sprite.n - shift)]
+		if sprite.lut is not None:
+			if not sprite.crossed:
+				pixels[indices] = sprite.lut[alpha]
+				return
+			plain = pixels[indices] == sprite.under
+			pixels[indices[plain]] = sprite.lut[alpha[plain]]
+			plain = ~plain
+			indices, alpha = indices[plain], alpha[plain]
+		covered = np.flatnonzero(alpha)
+		indices, alpha = indices[covered], alpha[covered] * np.float32(1 / 255)
+		values = pixels[indices].view(np.uint8).reshape(-1, 4).astype(np.float32)
+		values += (sprite.color - values) * alpha[:, None]
+		pixels[indices] = (values + 0.5).astype(np.uint8).view(np.uint32).ravel()
+
+	def render(self, frame):
+		# Pixels (height, width, 4) of frame, alpha isn't premultiplied
+		pixels = self.base.copy()
+		flat = pixels.view(np.uint32).ravel()
+		for sprite in self.sprites:
+			self.blend(flat, sprite, sprite.shifts[frame])
+		if not self.opaque:
+			flat = pixels.reshape(-1, 4)
+			edges = np.flatnonzero((flat[:, 3] > 0) & (flat[:, 3] < 255))
+			flat[edges, :3] = flat[edges, :3].astype(np.float32) * 255 / flat[edges, 3:] + 0.5
+		return pixels
+
+	def make_movie(self):
+		# Same frames than Video.make_movie, from 0 to the last key frame
+		for i in range(self.nb_frames + 1):
+			yield i, self.render(i)
+
+	def save_movie(self, path="./", name="out", ext="mp4"):
+		# Raw frames are given to ffmpeg, without png encoding
+		cmd = [
+			"ffmpeg", "-y",
+			"-f", "rawvideo", "-pix_fmt", "rgba",
+			"-s", f"{self.width}x{self.height}", "-r", f"{self.fps}", "-i", "-",
+			"-filter_complex", "[0:v] split [a][b];[a] palettegen [p];[b][p] paletteuse",
+			f"{path}{name}.{ext}"
+		]
+		# stderr is kept in a file, a pipe could fill up while frames are written
+		with TemporaryFile() as log:
+			try:
+				pipe = Popen(cmd, stdin=PIPE, stderr=log)
+			except FileNotFoundError:
+				raise RuntimeError("ffmpeg is needed by sprite renderer")
+			stopped = False
+			try:
+				for _, frame in self.make_movie():
+					pipe.stdin.write(frame.tobytes())
+			except BrokenPipeError:
+				stopped = True  # ffmpeg exited early, its error is reported below
+			with suppress(BrokenPipeError):
+				pipe.stdin.close()
+			if pipe.wait() or stopped:
+				log.seek(0)
+				raise RuntimeError(f"ffmpeg failed to write {path}{name}.{ext}:\n"
+				                   f"{log.read().decode(errors='replace')}")
 
 
 def generate_cli():
@@ -199,6 +486,9 @@ def generate_cli():
 	               help="Name of output file.", default="HypnoticEllipse")
 	g.add_argument("-ext", "--extension", metavar="EXTENSION", type=str,
 	               help="Extension of the output file.", default="gif", choices=["gif", "mp4"])
+	g.add_argument("-bk", "--backend", metavar="STR", type=str,
+	               help="Renderer of frames, sprite rasterizes each ellipse once and turns it. Default is svg.",
+	               default="svg", choices=["svg", "sprite"])
 
 	g = ap.add_argument_group("Misc")
 	g.add_argument("-v", "--version", action="version", help="show version number and exit",
@@ -218,7 +508,7 @@ def main():
 	                           duration=args.duration, bg=args.background_color,
 	                           color=args.color, gdt=args.gradient,
 	                           type=args.type, name=args.output, ext=args.extension,
-	                           seed=args.seed)
+	                           seed=args.seed, backend=args.backend)
 	hyptonic.generate_ellipse()
 	hyptonic.make_animation()
 
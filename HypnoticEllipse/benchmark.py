@@ -0,0 +1,104 @@
+# Micro benchmarks of HypnoticEllipse renderers
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+from time import perf_counter
+from argparse import ArgumentParser
+
+import numpy as np
+from cairosvg import svg2png
+
+from HypnoticEllipse import HypnoticEllipse, SpriteRenderer, AnimGenerator
+# endregion Imports
+
+def generate(nb_ellipse, size, seed, type="CHAOS", rx=10, ry=10):
+	hypnotic = HypnoticEllipse(fps=30, rx=rx, ry=ry, om="both", stroke=1, linecaps="round", gap=1,
+	                           nb_ellipse=nb_ellipse, sens=1, duration=10, bg="white", color="26,158,53", gdt="down",
+	                           type=type, name="benchmark", ext="gif", seed=seed)
+	hypnotic.generate_ellipse()
+	hypnotic.svg.set_size(size, size)
+	return hypnotic
+
+def bench_frames(nb_ellipse, size, frames, seed):
+	# Frames of a 10 s, 30 fps clip, svg rasterized by cairo against sprites turned by numpy
+	hypnotic = generate(nb_ellipse, size, seed)
+	picked = set(np.linspace(0, hypnotic.svg.get_nb_frames(), frames).astype(int).tolist())
+
+	start = perf_counter()
+	renderer = SpriteRenderer(hypnotic.svg, hypnotic.fps)
+	setup = perf_counter() - start
+	start = perf_counter()
+	for i in picked:
+		renderer.render(i)
+	sprite = (perf_counter() - start) / len(picked)
+
+	# Frames of Video.make_movie, the svg isn't reset at the end
+	start = perf_counter()
+	hypnotic.svg.init_animation()
+	for i in range(max(picked) + 1):
+		hypnotic.svg.update()
+		if i in picked:
+			svg2png(hypnotic.svg.get_svg())
+	svg = (perf_counter() - start) / len(picked)
+
+	clip = hypnotic.svg.get_nb_frames() + 1
+	print(f"{'frames':>8} {nb_ellipse:>5} ellipses {size:>5} px svg {svg * 1000:8.1f} ms/frame "
+	      f"sprite {sprite * 1000:8.1f} ms/frame setup {setup:6.2f} s "
+	      f"clip x{svg * clip / (sprite * clip + setup):.1f}")
+
+def bench_types(nb_ellipse, size, frames, seed):
+	# Sprite frames of each generator, ellipses have wider rings than circles
+	for type in AnimGenerator:
+		for rx, ry in [(10, 10), (10, 25)]:
+			hypnotic = generate(nb_ellipse, size, seed, type.value, rx, ry)
+			start = perf_counter()
+			renderer = SpriteRenderer(hypnotic.svg, hypnotic.fps)
+			setup = perf_counter() - start
+			picked = np.linspace(0, renderer.nb_frames, frames).astype(int)
+			start = perf_counter()
+			for i in picked:
+				renderer.render(i)
+			sprite = (perf_counter() - start) / len(picked)
+			print(f"{type.value:>8} {nb_ellipse:>5} ellipses {rx:>3}x{ry:<3} {size:>5} px "
+			      f"sprite {sprite * 1000:8.1f} ms/frame setup {setup:6.2f} s")
+
+BENCHMARKS = {
+	"frames": bench_frames,
+	"types": bench_types,
+}
+
+def generate_cli():
+	ap = ArgumentParser(
+			description="Micro benchmarks of HypnoticEllipse renderers.",
+			add_help=False,
+	)
+
+	g = ap.add_argument_group("Benchmark")
+	g.add_argument("-b", "--benchmark", metavar="STR", type=str, nargs="+",
+	               help="Benchmarks to run. Default all.", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+	g.add_argument("-nb", "--ellipse", metavar="INT", type=int, nargs="+",
+	               help="Number of ellipse arcs for each run.", default=[10, 30])
+	g.add_argument("-sz", "--size", metavar="INT", type=int,
+	               help="Width and height of frames in pixel. Default is 1500.", default=1500)
+	g.add_argument("-f", "--frames", metavar="INT", type=int,
+	               help="Number of frames rendered by run. Default is 30.", default=30)
+	g.add_argument("-s", "--seed", metavar="INT", type=int,
+	               help="Seed for initialization of the random number generator for predictable results.", default=0)
+
+	g = ap.add_argument_group("Misc")
+	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
+	               version=f"%(prog)s V.{__version__}")
+	g.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+	return ap
+
+def main():
+	args = generate_cli().parse_args()
+	for name in args.benchmark:
+		for nb_ellipse in args.ellipse:
+			BENCHMARKS[name](nb_ellipse, args.size, args.frames, args.seed)
+
+if __name__ == '__main__':
+	main()
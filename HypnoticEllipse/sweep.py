@@ -0,0 +1,124 @@
+# Sweep of HypnoticEllipse seeds over processes, summaries and thumbnails to choose animations to render
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+import os
+import sys
+import json
+from functools import partial
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from SVGVideoMaker import EllipseArc
+
+from HypnoticEllipse import HypnoticEllipse, SpriteRenderer, AnimGenerator, rotations
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared helpers at the root
+from raster import write_png
+# endregion Imports
+
+def generate(seed, args):
+	# Ellipses of a seed with the default style of HypnoticEllipse
+	hypnotic = HypnoticEllipse(fps=args.frame_per_seconds, rx=args.x_radius, ry=args.y_radius, om="both", stroke=1,
+	                           linecaps="round", gap=1, nb_ellipse=args.ellipse, sens=1, duration=args.duration,
+	                           bg="white", color="26,158,53", gdt="down", type=args.type, name=f"{args.output}-{seed}",
+	                           ext=args.extension, seed=seed, backend=args.backend)
+	hypnotic.generate_ellipse()
+	return hypnotic
+
+def summarize(seed, args):
+	# Arcs of a seed with their metrics, the thumbnail is the middle frame drawn by sprites
+	hypnotic = generate(seed, args)
+	nb_frames = hypnotic.svg.get_nb_frames()
+	arcs = [element for element in hypnotic.svg.group if isinstance(element, EllipseArc)]
+	lengths = np.array([(arc.ea - arc.sa) / 360 for arc in arcs])
+	turns = np.array([abs(rotations(arc, nb_frames)[-1]) / 360 for arc in arcs])
+	if args.thumbnail_size:
+		hypnotic.svg.set_size(args.thumbnail_size, args.thumbnail_size)
+		pixels = SpriteRenderer(hypnotic.svg, hypnotic.fps).render(nb_frames // 2).astype(np.float32)
+		alpha = pixels[..., 3:] / 255
+		write_png(f"{args.output}-{seed}.png", (pixels[..., :3] * alpha + 255 * (1 - alpha) + 0.5).astype(np.uint8))
+	return {
+		"seed": seed,
+		"arcs": len(arcs),
+		"length": float(lengths.mean()) if len(arcs) else 0.0,
+		"shortest": float(lengths.min()) if len(arcs) else 0.0,
+		"turns": float(turns.sum()),
+		"fastest": float(turns.max()) if len(arcs) else 0.0,
+	}
+
+def render(seed, args):
+	# Full video of a chosen seed, as HypnoticEllipse does
+	generate(seed, args).make_animation()
+
+def generate_cli():
+	ap = ArgumentParser(
+			description="Make HypnoticEllipse seeds in parallel, with metrics and thumbnails to choose the ones to render.",
+			epilog="Report bugs, request features, or provide suggestions via https://github.com/evayann/NiceEffects",
+			add_help=False
+	)
+
+	g = ap.add_argument_group("Generation")
+	g.add_argument("-s", "--seed", metavar="INT", type=int,
+	               help="First seed of the sweep. Default is 0.", default=0)
+	g.add_argument("-c", "--count", metavar="INT", type=int,
+	               help="Number of seeds to make. Default is 16.", default=16)
+	g.add_argument("-nb", "--ellipse", metavar="INT", type=int,
+	               help="number of concentric ellipse arc elements to generate inside the ellipse ", default=10)
+	g.add_argument("-rx", "--x-radius", metavar="INT", type=int, help="setup x radius of ellipse shape",
+	               default=10, choices=range(3, 31))
+	g.add_argument("-ry", "--y-radius", metavar="INT", type=int, help="setup x radius of ellipse shape",
+	               default=10, choices=range(3, 31))
+	g.add_argument("-t", "--type", metavar="STR", type=str,
+	               help="Type of generation system.", default="CHAOS", choices=[t.value for t in AnimGenerator])
+	g.add_argument("-w", "--workers", metavar="INT", type=int,
+	               help="Number of processes who make seeds, 0 for all cores. Default is 0.", default=0)
+
+	g = ap.add_argument_group("Output")
+	g.add_argument("-o", "--output", metavar="FILENAME", type=str,
+	               help="Prefix of the summary json, thumbnails and videos, followed by the seed.", default="Sweep")
+	g.add_argument("-ts", "--thumbnail-size", metavar="INT", type=int,
+	               help="Width and height in pixel of thumbnails, 0 for none. Default is 128.", default=128)
+	g.add_argument("-r", "--render", metavar="INT", type=int, nargs="+",
+	               help="Seeds to render as videos instead of sweeping.", default=None)
+	g.add_argument("-d", "--duration", metavar="INT", type=int, help="Time in second to make one animation. Default 10 seconds",
+	               default=10, choices=range(3, 31))
+	g.add_argument("-fps", "--frame-per-seconds", metavar="INT", type=int,
+	               help="The number of frame per seconds.", default=30)
+	g.add_argument("-ext", "--extension", metavar="EXTENSION", type=str,
+	               help="Extension of rendered videos.", default="gif", choices=["gif", "mp4"])
+	g.add_argument("-bk", "--backend", metavar="STR", type=str,
+	               help="Renderer of videos, sprite rasterizes each ellipse once and turns it. Default is svg.",
+	               default="svg", choices=["svg", "sprite"])
+
+	g = ap.add_argument_group("Misc")
+	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
+	               version=f"%(prog)s V.{__version__}")
+	g.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+	return ap
+
+def main():
+	args = generate_cli().parse_args()
+	seeds = args.render or list(range(args.seed, args.seed + args.count))
+	workers = min(args.workers or os.cpu_count(), len(seeds))
+
+	with ProcessPoolExecutor(workers) as pool:
+		if args.render:
+			list(pool.map(partial(render, args=args), seeds))
+			return
+		summaries = list(pool.map(partial(summarize, args=args), seeds))
+
+	with open(f"{args.output}.json", "w") as f:
+		json.dump(summaries, f, indent=1)
+	print(f"{'seed':>8} {'arcs':>5} {'length':>7} {'shortest':>9} {'turns':>7} {'fastest':>8}")
+	for summary in summaries:
+		print(f"{summary['seed']:>8} {summary['arcs']:>5} {summary['length']:>7.1%} {summary['shortest']:>9.1%} "
+		      f"{summary['turns']:>7.1f} {summary['fastest']:>8.1f}")
+
+if __name__ == '__main__':
+	main()
@@ -5,26 +5,45 @@ __author__ = "Yann Zavattero"
 __version__ = "1"
 
 # region Imports
+import os
 import sys
-from random import randint, seed as set_seed, choice
+import json
+from time import perf_counter
+from tempfile import mkstemp
+from random import randint, seed as set_seed, choice, getrandbits, getstate, setstate
 from math import sqrt
 from argparse import ArgumentParser
 
+import numpy as np
+
 from SVGVideoMaker.video import Video
-from SVGVideoMaker.geo.point import Point, Point2D
+from SVGVideoMaker.geo.point import Point2D
 from SVGVideoMaker.geo.polygon import Polygon
 from SVGVideoMaker.geo.svg import SVG
 # endregion Imports
 
-class Vector(Point):
+class Vector:
 	"""
-    2D vector.
+    Immutable 2D vector.
     """
+	__slots__ = ("coordinates",)
 
 	def __init__(self, x: float, y: float):
-		super().__init__([x, y])
-		self.x = x
-		self.y = y
+		object.__setattr__(self, "coordinates", (x, y))
+
+	def __setattr__(self, name, value):
+		raise AttributeError("Vector is immutable")
+
+	def __reduce__(self):
+		return Vector, self.coordinates
+
+	@property
+	def x(self) -> float:
+		return self.coordinates[0]
+
+	@property
+	def y(self) -> float:
+		return self.coordinates[1]
 
 	def copy(self) -> "Vector":
 		"""Copies the vector"""
@@ -79,170 +98,348 @@ class Vector(Point):
 		return f"V({self.coordinates})"
 
 
-marked = set()
-
-
 class Agent:
-	def __init__(self, position, forward_unit):
-		self.position = position
-		self.forward_vec = forward_unit
+	__slots__ = ("position", "forward_dir")
+
+	def __init__(self, position, forward_dir):
+		self.position = position  # cell index
+		self.forward_dir = forward_dir  # index in GameMap.DIRECTIONS
 
 	def move(self, direction, new_position):
-		self.forward_vec = direction
+		self.forward_dir = direction
 		self.position = new_position
 
 	def forward(self):
-		return self.forward_vec
+		return self.forward_dir
 
 	def backward(self):
-		return -self.forward_vec
+		return (self.forward_dir + 2) % 4
 
 	def right(self):
-		return self.forward_vec.orthogonal()
+		return (self.forward_dir + 1) % 4
 
 	def left(self):
-		return -self.forward_vec.orthogonal()
-
-	@staticmethod
-	def cell_coords(pos):
-		return Vector(int(pos.x), int(pos.y))
+		return (self.forward_dir + 3) % 4
 
 
 class Player:
+	__slots__ = ("id", "position", "spawn", "static", "topleft", "parent", "parent_blacklist", "boundaries",
+	             "outline", "box")
+
 	def __init__(self, id, pos, static):
 		self.id = id
-		self.position = pos
+		self.position = pos  # cell index
 		self.spawn = pos
 		self.static = static
-		self.topleft = None
+		self.topleft = None  # x, y
 		self.parent = None
 		self.parent_blacklist = set()
-		self.boundaries = None
+		self.boundaries = None  # x, y of points
+		self.outline = None  # parent id and polygon of boundaries, kept while they don't change
+		self.box = None  # cells of the territory are in, never shrinks
+
+	def grow(self, x, y):
+		if self.box is None:
+			self.box = [x, y, x, y]
+		else:
+			box = self.box
+			box[0], box[1], box[2], box[3] = min(box[0], x), min(box[1], y), max(box[2], x), max(box[3], y)
 
 	def __str__(self):
 		return f"Player({self.id})"
 
 
+def crack_contours(labels, heads):
+	# Cracks are the sides of a cell toward a cell of another owner, by wall up, right, down, left.
+	# Like the agent of territory_boundaries, the next crack keeps the territory on the right and
+	# turns at the first cell ahead or beside it of the same owner. Outlines are cycles of next
+	# cracks, ordered from the top crack of each head cell with pointer doubling.
+	# labels has a margin of one cell without traced owners, heads are flat indices in it.
+	h, w = labels.shape
+	flat = labels.ravel()
+	steps = np.array([-w, 1, w, -1])
+	heads = np.asarray(heads, dtype=np.int64)
+	traced = np.zeros(flat.max() + 3, dtype=bool)  # by owner + 2
+	traced[flat[heads] + 2] = True
+	cells = np.flatnonzero(traced[flat + 2])
+
+	owners = flat[cells]
+	cell, wall = np.nonzero(flat[cells[:, None] + steps] != owners[:, None])
+	cell, owners = cells[cell], owners[cell]
+	ids = cell * 4 + wall
+	turn = (wall + 1) % 4
+	ahead = cell + steps[turn]
+	on_ahead = flat[ahead] == owners
+	on_side = on_ahead & (flat[ahead + steps[wall]] == owners)
+	next_cell = np.where(on_side, ahead + steps[wall], np.where(on_ahead, ahead, cell))
+	next_wall = np.where(on_side, (wall + 3) % 4, np.where(on_ahead, wall, turn))
+	jump = np.searchsorted(ids, next_cell * 4 + next_wall)
+
+	# smallest crack of each cycle, then cracks of cycles with a head
+	cycle = np.arange(len(ids))
+	while True:
+		low = np.minimum(cycle, cycle[jump])
+		if np.array_equal(low, cycle):
+			break
+		cycle, jump = low, jump[jump]
+	head = np.searchsorted(ids, heads * 4)
+	keep = np.flatnonzero(np.isin(cycle, cycle[head]))
+	position = np.full(len(ids), -1)
+	position[keep] = np.arange(len(keep))
+	jump = position[np.searchsorted(ids, next_cell[keep] * 4 + next_wall[keep])]
+	cell, wall = cell[keep], wall[keep]
+	head = position[head]
+
+	# steps to the head
+	is_head = np.zeros(len(keep), dtype=bool)
+	is_head[head] = True
+	dist = np.where(is_head, 0, 1)
+	jump[head] = head
+	while not is_head[jump].all():
+		dist, jump = dist + dist[jump], jump[jump]
+	rank = np.full(len(keep), -1)
+	rank[head] = np.arange(len(head))
+	size = np.bincount(jump, minlength=len(keep))
+	order = np.lexsort(((size[jump] - dist) % size[jump], rank[jump]))
+	cell, wall = cell[order], wall[order]
+	offsets = np.concatenate([[0], np.cumsum(size[head])])
+	return offsets, cell % w, cell // w, wall, flat[cell + steps[wall]]
+
 class GameMap:
+	# Owner ids of cells with 2 more cells on each side, all moves are index offsets
+	EMPTY, OUTSIDE = -1, -2
+	# directions in the order of Vector.orthogonal, random_direction draws them in its own order
+	DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+	RANDOM_DIRECTIONS = (2, 0, 3, 1)
+
 	def __init__(self, width, height):
 		self.width = width
 		self.height = height
 		self.size = width * height
-		self.grid = [None] * self.size
+		self.stride = width + 4
+		self.cells = self.new_cells()
+		self.same = bytearray(len(self.cells))  # count of 4-neighbors with the owner of the cell
+		self.occupied = bytearray(len(self.cells))  # cells with a player on
+		self.steps = [dy * self.stride + dx for dx, dy in GameMap.DIRECTIONS]
 		self.players = []
-		self.player_positions = set()
+		self.dirty = set()  # ids of players whose cells or cells around changed
+		self.turn = 0  # turns played
+
+	def new_cells(self):
+		row = [GameMap.OUTSIDE] * 2 + [GameMap.EMPTY] * self.width + [GameMap.OUTSIDE] * 2
+		border = [GameMap.OUTSIDE] * (2 * self.stride)
+		return border + row * self.height + border
+
+	def index(self, x, y):
+		return (y + 2) * self.stride + x + 2
+
+	def coordinates(self, cell):
+		return cell % self.stride - 2, cell // self.stride - 2
 
 	def __getitem__(self, position):
-		x, y = position
-		return self.grid[y * self.width + x]
+		owner = self.cells[self.index(*position)]
+		return self.players[owner] if owner >= 0 else None
 
 	def __setitem__(self, key, value):
-		x, y = key
-		self.grid[y * self.width + x] = value
+		# cells are never freed in a battle
+		self.set_owner(self.index(*key), value)
 
 	def random_position(self):
 		idx = randint(0, self.size - 1)
-		x, y = idx % self.width, idx // self.width
-		return idx, Vector(x, y)
+		return self.index(idx % self.width, idx // self.width)
 
 	def random_empty_position(self):
-		idx, vec = self.random_position()
-		while self.grid[idx] is not None:
-			idx, vec = self.random_position()
-		return idx, vec
-
-	def neighbors8(self, pos):
-		for i in range(-1, 2):
-			for j in range(-1, 2):
-				if i != 0 or j != 0:
-					neighbor = pos + Vector(i, j)
-					if not self.out_of_bounds(neighbor):
-						yield neighbor, self[neighbor]
-
-	def neighbors4(self, pos):
-		v = Vector(0, -1)
-		for _ in range(4):
-			neighbor = pos + v
-			if not self.out_of_bounds(neighbor):
-				yield neighbor, self[neighbor]
-			v = v.orthogonal()
-
-	def out_of_bounds(self, vec):
-		return not (0 <= vec.x < self.width) or not (0 <= vec.y < self.height)
+		cell = self.random_position()
+		while self.cells[cell] != GameMap.EMPTY:
+			cell = self.random_position()
+		return cell
+
+	def out_of_bounds(self, cell):
+		return self.cells[cell] == GameMap.OUTSIDE
 
 	@staticmethod
 	def random_direction():
-		directions = [Vector(-1, 0), Vector(1, 0), Vector(0, -1), Vector(0, 1)]
-		return choice(directions)
-
-	def is_valid_move(self, player, v):
-		src = player.position
-		dst = src + v
-		if self.out_of_bounds(dst):
+		return choice(GameMap.RANDOM_DIRECTIONS)
+
+	def is_valid_move(self, player, d):
+		cells = self.cells
+		v, o = self.steps[d], self.steps[(d + 1) % 4]
+		dst = player.position + v
+		target = cells[dst]
+		if target == GameMap.OUTSIDE:
 			return False
-		if self[dst] == player or self[dst] is None:
+		if target == player.id or target == GameMap.EMPTY:
 			return True
-		if dst in self.player_positions:
+		if self.occupied[dst]:
 			return False
-		up = dst + v
-		right = dst + v.orthogonal()
-		left = dst - v.orthogonal()
-		for cell, lim in [(dst, 2), (right, 2), (left, 2), (up, 2)]:
-			if not self.out_of_bounds(cell):
-				cell_owner = self[cell]
-				if cell_owner is not None:
-					neighbors_count = sum(1 for _, owner in self.neighbors4(cell) if owner == cell_owner)
-					# print(neighbors_count, "for", dst)
-					if neighbors_count <= lim:
-						return False
+		same = self.same
+		for cell in (dst, dst + o, dst - o, dst + v):
+			if cells[cell] >= 0 and same[cell] <= 2:
+				return False
 		return True
 
-	def move_player(self, player, vec):
-		oldpos = player.position
-		newpos = oldpos + vec
-		self.player_positions.remove(oldpos)
-		self.player_positions.add(newpos)
-		self[newpos] = player
-		player.position = newpos
+	def set_owner(self, cell, player):
+		# keep same up to date for the cell and its neighbors
+		cells, same = self.cells, self.same
+		old, new = cells[cell], player.id
+		if old == new:
+			return
+		cells[cell] = new
+		self.dirty.add(new)
+		if old >= 0:
+			self.dirty.add(old)
+		player.grow(*self.coordinates(cell))
+		count = 0
+		for step in self.steps:
+			owner = cells[cell + step]
+			if owner < 0:
+				continue
+			# the border of neighbors meets another player
+			self.dirty.add(owner)
+			if owner == old:
+				same[cell + step] -= 1
+			elif owner == new:
+				same[cell + step] += 1
+				count += 1
+		same[cell] = count
+
+	def move_player(self, player, d):
+		dst = player.position + self.steps[d]
+		self.occupied[player.position] = 0
+		self.occupied[dst] = 1
+		self.set_owner(dst, player)
+		player.position = dst
 
 	def play_turn(self):
 		for player in self.players:
 			if not player.static:
-				v = GameMap.random_direction()
+				d = GameMap.random_direction()
 				i = 0
-				while i < 4 and not self.is_valid_move(player, v):
-					v = v.orthogonal()
+				while i < 4 and not self.is_valid_move(player, d):
+					d = (d + 1) % 4
 					i += 1
 
 				if i < 4:  # valid move found => play it
-					self.move_player(player, v)
+					self.move_player(player, d)
 				# else : stay here!
 
 	def spawn_player(self, player_id, static):
-		idx, position = self.random_empty_position()
+		cell = self.random_empty_position()
 		if static:
 			print("STATIC", player_id, file=sys.stderr)
-		player = Player(player_id, position, static)
-		self.grid[idx] = player
+		player = Player(player_id, cell, static)
+		self.set_owner(cell, player)
+		self.occupied[cell] = 1
 		self.players.append(player)
-		self.player_positions.add(position)
 
-	def compute_topleft_cells(self):
+	def flush(self):
+		# positions of players are always up to date
+		pass
+
+	def grid(self):
+		# owner ids of the cells of the map
+		return np.array(self.cells, dtype=np.int32).reshape(self.height + 4, self.stride)[2:-2, 2:-2]
+
+	def set_owners(self, owners):
+		grid = np.full((self.height + 4, self.stride), GameMap.OUTSIDE, dtype=np.int32)
+		grid[2:-2, 2:-2] = owners
+		self.cells = grid.reshape(-1).tolist()
+		self.count_same(grid)
+
+	def count_same(self, grid):
+		same = sum(grid == np.roll(grid, step, axis=axis) for step in (1, -1) for axis in (0, 1)) * (grid >= 0)
+		self.same[:] = same.astype(np.uint8).tobytes()
+
+	@staticmethod
+	def box_area(players):
+		return sum((p.box[2] - p.box[0] + 1) * (p.box[3] - p.box[1] + 1) for p in players)
+
+	def compute_topleft_cells(self, players=None):
+		# the scan doesn't move the topleft of a player whose cells didn't change
+		cells = self.cells
+		if players is not None and self.box_area(players) < self.size:
+			# same scan restricted to the box of each player
+			for player in players:
+				x0, y0, x1, y1 = player.box
+				for j in range(y0, y1 + 1):
+					row = self.index(0, j)
+					for i in range(x0, x1 + 1):
+						if cells[row + i] == player.id:
+							top = player.topleft
+							if top is None or top[0] > i or top[1] > j:
+								player.topleft = i, j
+			return
+
 		for j in range(self.height):
+			row = self.index(0, j)
 			for i in range(self.width):
-				pos = Vector(i, j)
-				owner = self[pos]
-				if owner is not None:
-					if owner.topleft is None or owner.topleft.x > pos.x or owner.topleft.y > pos.y:
-						owner.topleft = pos
+				owner = cells[row + i]
+				if owner >= 0:
+					player = self.players[owner]
+					top = player.topleft
+					if top is None or top[0] > i or top[1] > j:
+						player.topleft = i, j
+
+	def outlines(self):
+		# parent id and boundaries of players, only those whose borders could change are traced again
+		dirty = [self.players[i] for i in sorted(self.dirty)]
+		self.dirty.clear()
+		self.compute_topleft_cells(dirty)
+		self.trace_boundaries(dirty)
+		for p in dirty:
+			p.outline = None
+		for p in self.players:
+			parent_id = -1 if ((p.parent is None) or (p.parent in p.parent_blacklist)) else p.parent.id
+			yield parent_id, p.boundaries
 
 	def compute_boundaries(self):
-		self.compute_topleft_cells()
-		for p in self.players:
+		# polygons are kept while boundaries and parent don't change
+		for p, (parent_id, boundaries) in zip(self.players, self.outlines()):
+			if p.outline is None or p.outline[0] != parent_id:
+				p.outline = parent_id, Polygon([Vector(x, y) for x, y in boundaries], id=parent_id)
+			yield p.outline[1]
+
+	def labels(self, box):
+		# owner ids of the box and one more cell around
+		x0, y0, x1, y1 = box
+		return np.array([self.cells[self.index(x0 - 1, j):self.index(x1 + 2, j)] for j in range(y0 - 1, y1 + 2)],
+		                dtype=np.int32)
+
+	def trace_boundaries(self, players):
+		# Boundaries, parents and blacklists of players as territory_boundaries gives them,
+		# from the cracks of all their territories at once.
+		lost = [p for p in players if self.cells[self.index(*p.topleft)] != p.id]  # a topleft out of the territory
+		players = [p for p in players if self.cells[self.index(*p.topleft)] == p.id]
+		for p in lost:
 			p.boundaries = self.territory_boundaries(p)
-		for p in self.players:
-			parent_id = -1 if ((p.parent is None) or (p.parent in p.parent_blacklist)) else p.parent.id
-			yield Polygon(p.boundaries, id=parent_id)
+		if not players:
+			return
+
+		x0, y0 = min(p.box[0] for p in players), min(p.box[1] for p in players)
+		x1, y1 = max(p.box[2] for p in players), max(p.box[3] for p in players)
+		labels = self.labels((x0, y0, x1, y1))
+		w = labels.shape[1]
+		heads = [(p.topleft[1] - y0 + 1) * w + p.topleft[0] - x0 + 1 for p in players]
+		offsets, x, y, wall, others = crack_contours(labels, heads)
+
+		# corner at the start of each crack, toward the cell
+		d = 0.49
+		corners = np.array([[-d, -d], [d, -d], [d, d], [-d, d]])
+		points = list(zip(((x + (x0 - 1)) + corners[wall, 0]).tolist(), ((y + (y0 - 1)) + corners[wall, 1]).tolist()))
+		low, high = np.minimum.reduceat(others, offsets[:-1]), np.maximum.reduceat(others, offsets[:-1])
+		for i, p in enumerate(players):
+			start, end = offsets[i], offsets[i + 1]
+			if end - start == 4:
+				end -= 1  # the agent of a lone cell never turns back to its first point
+			p.boundaries = points[start:end]
+			# the parent is all around, not the border of the map
+			p.parent = self.players[low[i]] if low[i] == high[i] and low[i] >= 0 else None
+
+		owners = np.repeat(np.arange(len(players)), np.diff(offsets))
+		near = others >= 0
+		pairs = np.unique(others[near].astype(np.int64) * len(players) + owners[near])
+		for other, i in zip((pairs // len(players)).tolist(), (pairs % len(players)).tolist()):
+			self.players[other].parent_blacklist.add(players[i])
 
 	def territory_boundaries(self, player):
 		# 1. On positionne l'agent pour qu'il soit contre le bord, avec le bord à sa gauche.
@@ -251,20 +448,18 @@ class GameMap:
 			self.compute_topleft_cells()
 			start_pos = player.topleft
 
-		agent = Agent(start_pos, Vector(1, 0))
+		agent = Agent(self.index(*start_pos), 0)
 
 		# 2. On suit le bord pour le détecter.
 
-		# Position relative des bords du polygone, selon l'orientation de l'agent
+		# Position relative des bords du polygone, selon la direction de l'agent
 		d = 0.49
 		border_offsets = [
-			[Vector(-d, d), Vector(-d, -d), Vector(d, -d), None],
-			[Vector(-d, -d), Vector(d, -d), Vector(d, d), None],
-			[Vector(d, -d), Vector(d, d), Vector(-d, d), None],
-			[Vector(d, d), Vector(-d, d), Vector(-d, -d), None]
+			[(-d, -d), (d, -d), (d, d), None],
+			[(d, -d), (d, d), (-d, d), None],
+			[(d, d), (-d, d), (-d, -d), None],
+			[(-d, d), (-d, -d), (d, -d), None]
 		]
-		# Orientations possibles
-		orientations = [Vector(0, -1), Vector(1, 0), Vector(0, 1), Vector(-1, 0)]
 		# Mouvements par ordre de priorité.
 		moves = [Agent.left, Agent.forward, Agent.right, Agent.backward]
 
@@ -276,14 +471,13 @@ class GameMap:
 		not_initialized = object()
 		potential_parent = not_initialized
 		run = True
-		marked.add(agent.position)  # DEBUG
 		while run:
 			# Déplace l'agent en essayant les mouvements dans l'ordre de priorité donné ci-avant.
-			orientation = orientations.index(agent.forward_vec)
-			for move_provider, border_offset in zip(moves, border_offsets[orientation]):
-				move_vec = move_provider(agent)
-				new_position = agent.position + move_vec
-				if self.out_of_bounds(new_position) or self[new_position] != player:
+			for move_provider, border_offset in zip(moves, border_offsets[agent.forward_dir]):
+				move = move_provider(agent)
+				new_position = agent.position + self.steps[move]
+				owner = self.cells[new_position]
+				if owner != player.id:
 					# Mur rencontré
 
 					# Détection du parent: on en a un si à chaque fois l'obstacle est le même polygone (le parent)
@@ -291,10 +485,10 @@ class GameMap:
 					# Exemple où il n'y a pas de parent: battle-100-100-100-250-424242, polygones 13 et 35
 					# Exemple où il y en a un: battle-100-100-1000-250-424242, polygones 480 et 660
 					# (exemples sans la fonctionnalité "static")
-					if self.out_of_bounds(new_position):
+					if owner == GameMap.OUTSIDE:
 						potential_parent = None  # pas de parent si on touche le bord de la grille de jeu
 					else:
-						other = self[new_position]
+						other = self.players[owner] if owner >= 0 else None
 						if other is not None:
 							other.parent_blacklist.add(player)
 
@@ -309,7 +503,8 @@ class GameMap:
 						break
 
 					# Autre déplacement, on ajoute un point à la frontière
-					point = agent.position + border_offset
+					x, y = self.coordinates(agent.position)
+					point = (x + border_offset[0], y + border_offset[1])
 					if points and point == points[0]:
 						# On est revenu au point de départ => terminé
 						run = False
@@ -320,8 +515,7 @@ class GameMap:
 					points_set.add(point)
 				else:
 					# La voie est libre, on continue
-					agent.move(move_vec, new_position)
-					marked.add(agent.position)
+					agent.move(move, new_position)
 					break
 
 		if potential_parent is not_initialized:  # improbable mais pas forcément impossible...
@@ -329,21 +523,475 @@ class GameMap:
 		player.parent = potential_parent
 		return points
 
-def run_agent_battle(grid_width, grid_height, players, n_static, turns, seed):
+class ArrayMap(GameMap):
+	# Owner ids in an int32 array, free cells in a pool for spawns on a full map
+
+	def __init__(self, width, height):
+		super().__init__(width, height)
+		# free cells, a taken one is swapped with the last
+		self.free = ((np.arange(height) + 2)[:, None] * self.stride + np.arange(width) + 2).reshape(-1)
+		self.slot = np.full(self.owners.size, -1, dtype=np.int64)
+		self.slot[self.free] = np.arange(self.size)
+		self.free, self.slot = memoryview(self.free), memoryview(self.slot)
+		self.nb_free = self.size
+		self.top = np.full(0, -1, dtype=np.int64)  # topleft cells, inside indices
+		self.synced = False  # positions and boxes of batch turns, stale after a sequential change
+		self.moved = False  # positions of batch turns not yet in players
+
+	def new_cells(self):
+		self.owners = np.full((self.height + 4, self.stride), GameMap.OUTSIDE, dtype=np.int32)
+		self.owners[2:-2, 2:-2] = GameMap.EMPTY
+		return memoryview(self.owners.reshape(-1))  # python ints on single cell access
+
+	def labels(self, box):
+		x0, y0, x1, y1 = box
+		return np.ascontiguousarray(self.owners[y0 + 1:y1 + 4, x0 + 1:x1 + 4])
+
+	def take(self, cell):
+		slot = self.slot[cell]
+		self.nb_free -= 1
+		last = self.free[self.nb_free]
+		self.free[slot] = last
+		self.slot[last] = slot
+		self.slot[cell] = -1
+
+	def random_empty_position(self):
+		# same draws as GameMap until 15 cells of 16 are taken, then draw among free cells
+		while self.nb_free * 16 >= self.size:
+			cell = self.random_position()
+			if self.cells[cell] == GameMap.EMPTY:
+				return cell
+		return self.free[randint(0, self.nb_free - 1)]
+
+	def take_all(self, cells):
+		# free cells keep their order in the pool
+		free, slot = np.asarray(self.free), np.asarray(self.slot)
+		slot[cells] = -1
+		left = free[:self.nb_free]
+		left = left[slot[left] >= 0]
+		self.nb_free = len(left)
+		free[:self.nb_free] = left
+		slot[left] = np.arange(self.nb_free)
+
+	def set_owner(self, cell, player):
+		if self.cells[cell] == GameMap.EMPTY:
+			self.take(cell)
+		self.synced = False
+		super().set_owner(cell, player)
+
+	def set_owners(self, owners):
+		self.owners[2:-2, 2:-2] = owners
+		self.take_all(np.flatnonzero(self.owners.reshape(-1) >= 0))
+		self.count_same(self.owners)
+		self.synced = False
+
+	def flush(self):
+		# positions of batch turns back to players
+		if self.moved:
+			for p, cell in zip(self.players, self.at.tolist()):
+				p.position = cell
+			self.moved = False
+
+	def play_turn(self):
+		self.flush()
+		super().play_turn()
+
+	def sync(self):
+		self.flush()
+		self.at = np.array([p.position for p in self.players], dtype=np.int64)
+		self.boxes = np.array([p.box for p in self.players], dtype=np.int64).reshape(-1, 4)
+		self.mobile = np.array([i for i, p in enumerate(self.players) if not p.static], dtype=np.int64)
+		self.synced = True
+
+	def play_batch_turn(self):
+		# Every mobile player proposes a move from the board of the turn start, with the tries of play_turn.
+		# Proposals on the same cell are settled by a priority drawn for the turn, then all moves are applied.
+		if not self.synced:
+			self.sync()
+		rng = np.random.default_rng(getrandbits(64))
+		owners = self.owners.reshape(-1)
+		same, occupied = np.frombuffer(self.same, dtype=np.uint8), np.frombuffer(self.occupied, dtype=np.uint8)
+		steps = np.array(self.steps)
+		# cells is_valid_move checks around the target of a move in each direction
+		checks = np.stack([np.zeros(4, dtype=np.int64), np.roll(steps, -1), -np.roll(steps, -1), steps], axis=1)
+		ids = self.mobile
+		src = self.at[ids]
+
+		dst = src[:, None] + steps
+		target = owners[dst]
+		valid = (target == ids[:, None]) | (target == GameMap.EMPTY)
+		enemy = np.flatnonzero(((target >= 0) & ~valid).reshape(-1))
+		enemy = enemy[occupied[dst.reshape(-1)[enemy]] == 0]
+		checked = dst.reshape(-1)[enemy, None] + checks[enemy % 4]
+		weak = ((owners[checked] >= 0) & (same[checked] <= 2)).any(axis=1)
+		valid.reshape(-1)[enemy[~weak]] = True
+		# first valid direction from a random one
+		tries = (rng.integers(0, 4, len(ids))[:, None] + np.arange(4)) % 4
+		valid = np.take_along_axis(valid, tries, axis=1)
+		found, first = valid.any(axis=1), valid.argmax(axis=1)
+		checked = np.where(found, first + 1, 4)  # directions play_turn would have checked
+		self.count_moves(int(checked.sum()), int(checked.sum() - found.sum()))
+		moves = np.flatnonzero(found)
+		ids, src, dst = ids[moves], src[moves], dst[moves, tries[moves, first[moves]]]
+
+		# one move by cell, the lowest priority drawn for the turn wins
+		order = np.argsort(dst * len(ids) + rng.permutation(len(ids)))
+		order = order[np.r_[True, dst[order][1:] != dst[order][:-1]]]
+		ids, src, dst = ids[order], src[order], dst[order]
+		occupied[src] = 0
+		occupied[dst] = 1
+		self.at[ids] = dst
+		self.moved = True
+
+		old = owners[dst]
+		taken = old != ids
+		ids, dst, old = ids[taken], dst[taken], old[taken]
+		self.take_all(dst[old == GameMap.EMPTY])
+		owners[dst] = ids
+		around = (dst[:, None] + steps).reshape(-1)
+		cells = np.concatenate([dst, around])  # cells counted again, twice is harmless
+		cells = cells[owners[cells] >= 0]
+		same[cells] = sum(owners[cells + step] == owners[cells] for step in self.steps)
+		dirty = np.zeros(len(self.players), dtype=bool)
+		dirty[ids] = True
+		dirty[old[old >= 0]] = True
+		dirty[owners[cells]] = True
+		self.dirty.update(np.flatnonzero(dirty).tolist())
+
+		# boxes that grow
+		x, y = dst % self.stride - 2, dst // self.stride - 2
+		boxes = self.boxes[ids]
+		grown = (x < boxes[:, 0]) | (y < boxes[:, 1]) | (x > boxes[:, 2]) | (y > boxes[:, 3])
+		ids, x, y, boxes = ids[grown], x[grown], y[grown], boxes[grown]
+		boxes = np.stack([np.minimum(boxes[:, 0], x), np.minimum(boxes[:, 1], y),
+		                  np.maximum(boxes[:, 2], x), np.maximum(boxes[:, 3], y)], axis=1)
+		self.boxes[ids] = boxes
+		for i, box in zip(ids.tolist(), boxes.tolist()):
+			self.players[i].box = box
+
+	def count_moves(self, checked, rejected):
+		# moves checked and rejected by a batch turn, a probe counts them as calls of is_valid_move
+		pass
+
+	def compute_topleft_cells(self, players=None):
+		# Same result as the row by row scan of GameMap: from the first cell of a player at the left
+		# or above its last topleft, the topleft is the top cell of its leftmost column.
+		top = np.full(len(self.players), -1, dtype=np.int64)
+		top[:len(self.top)] = self.top
+		self.top = top
+		if players is not None and self.box_area(players) < self.size:
+			for player in players:
+				x0, y0, x1, y1 = player.box
+				y, x = np.nonzero(self.owners[y0 + 2:y1 + 3, x0 + 2:x1 + 3] == player.id)
+				x, y = x + x0, y + y0
+				last = top[player.id]
+				scan = (last < 0) | (last % self.width > x) | (last // self.width > y)
+				if not scan.any():
+					continue
+				start = scan.argmax()
+				first = start + x[start:].argmin()  # top of the leftmost column
+				cell = y[first] * self.width + x[first]
+				if cell != last:
+					top[player.id] = cell
+					player.topleft = int(x[first]), int(y[first])
+			return
+
+		owners = self.owners[2:-2, 2:-2].reshape(-1)
+		cells = np.flatnonzero(owners >= 0)
+		ids = owners[cells]
+		order = np.argsort(ids, kind="stable")
+		cells, ids = cells[order], ids[order]
+		x, y = cells % self.width, cells // self.width
+
+		last = top[ids]
+		scan = (last < 0) | (last % self.width > x) | (last // self.width > y)
+		players, first = np.unique(ids[scan], return_index=True)
+		start = np.full(len(self.players), len(cells))
+		start[players] = np.flatnonzero(scan)[first]
+		key = np.where(np.arange(len(cells)) >= start[ids], x * self.height + y, self.size)
+		players, first = np.unique(ids, return_index=True)
+		key = np.minimum.reduceat(key, first)
+		players, key = players[key < self.size], key[key < self.size]
+		changed = top[players] != key % self.height * self.width + key // self.height
+		top[players] = key % self.height * self.width + key // self.height
+		for player, cell in zip(players[changed].tolist(), top[players[changed]].tolist()):
+			self.players[player].topleft = cell % self.width, cell // self.width
+
+MAPS = {"list": GameMap, "numpy": ArrayMap}
+MODES = {"sequential": "play_turn", "synchronous": "play_batch_turn"}  # synchronous is for numpy maps
+
+def save_checkpoint(game, path):
+	# State of a battle between two turns with the state of random, replaced at once on disk
+	game.flush()
+	players = game.players
+	state = getstate()
+	xy = lambda cells: np.array([game.coordinates(cell) for cell in cells], dtype=np.int32).reshape(-1, 2)
+	blacklist = [(p.id, other.id) for p in players for other in p.parent_blacklist]
+	with open(path + ".tmp", "wb") as file:
+		np.savez_compressed(
+				file,
+				map=np.array([game.width, game.height, game.turn], dtype=np.int64),
+				owners=game.grid(),
+				positions=xy(p.position for p in players),
+				spawns=xy(p.spawn for p in players),
+				static=np.array([p.static for p in players], dtype=bool),
+				topleft=np.array([p.topleft or (-1, -1) for p in players], dtype=np.int32).reshape(-1, 2),
+				boxes=np.array([p.box for p in players], dtype=np.int32).reshape(-1, 4),
+				parents=np.array([-1 if p.parent is None else p.parent.id for p in players], dtype=np.int32),
+				blacklist=np.array(blacklist, dtype=np.int32).reshape(-1, 2),
+				random=np.array(state[1], dtype=np.uint32),
+				gauss=np.array([np.nan if state[2] is None else state[2]]),
+		)
+	os.replace(path + ".tmp", path)
+
+def load_checkpoint(path, backend="list"):
+	# Battle of a checkpoint on any backend, random continues where it was saved
+	with np.load(path) as data:
+		width, height, turn = data["map"].tolist()
+		game = MAPS[backend](width, height)
+		game.turn = turn
+		game.set_owners(data["owners"])
+		index = lambda xy: [game.index(x, y) for x, y in xy.tolist()]
+		for i, (cell, spawn, static) in enumerate(zip(index(data["positions"]), index(data["spawns"]),
+		                                              data["static"].tolist())):
+			player = Player(i, cell, static)
+			player.spawn = spawn
+			game.occupied[cell] = 1
+			game.players.append(player)
+		for player, topleft, box, parent in zip(game.players, data["topleft"].tolist(), data["boxes"].tolist(),
+		                                        data["parents"].tolist()):
+			player.topleft = None if topleft[0] < 0 else tuple(topleft)
+			player.box = box
+			player.parent = None if parent < 0 else game.players[parent]
+		for i, other in data["blacklist"].tolist():
+			game.players[i].parent_blacklist.add(game.players[other])
+		if isinstance(game, ArrayMap):
+			game.top = np.array([-1 if p.topleft is None else p.topleft[1] * width + p.topleft[0]
+			                     for p in game.players], dtype=np.int64)
+		gauss = data["gauss"][0]
+		setstate((3, tuple(data["random"].tolist()), None if np.isnan(gauss) else float(gauss)))
+	game.dirty.update(range(len(game.players)))  # boundaries are traced again
+	return game
+
+def simplify(points):
+	# drop points on the segment of their neighbors, straight borders are runs of cell corners
+	xy = np.array(points)
+	before, after = xy - np.roll(xy, 1, axis=0), np.roll(xy, -1, axis=0) - xy
+	return xy[np.abs(before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]) > 1e-9]
+
+def resample(xy, count):
+	# split edges in parts by their length until there are count points, corners stay
+	extra = count - len(xy)
+	if extra <= 0:
+		return xy
+	edges = np.roll(xy, -1, axis=0) - xy
+	share = np.hypot(edges[:, 0], edges[:, 1])
+	share *= extra / share.sum()
+	parts = np.floor(share).astype(np.int64)
+	parts[np.argsort(parts - share)[:extra - parts.sum()]] += 1  # largest remainders
+	parts += 1
+	t = np.arange(count) - np.repeat(np.cumsum(parts) - parts, parts)
+	return np.repeat(xy, parts, axis=0) + (t / np.repeat(parts, parts))[:, None] * np.repeat(edges, parts, axis=0)
+
+class Probe:
+	"""
+	Timings and counters of the phases of a battle, a line of json by turn in a file.
+	It wraps the methods of one map until closed, a map without probe runs them as they are.
+	Times of a phase include the phases it calls.
+	"""
+	PHASES = ["play_turn", "play_batch_turn", "compute_topleft_cells", "trace_boundaries", "territory_boundaries"]
+
+	def __init__(self, game, path):
+		self.game = game
+		self.file = open(path, "w")
+		self.record = None
+		self.wrapped = [name for name in Probe.PHASES if hasattr(game, name)] + ["is_valid_move"]
+		for name in Probe.PHASES:
+			if hasattr(game, name):
+				setattr(game, name, self.timed(name, getattr(game, name)))
+		is_valid_move = game.is_valid_move
+
+		def counted(player, d):
+			valid = is_valid_move(player, d)
+			self.add("checked_moves")
+			if not valid:
+				self.add("rejected_moves")
+			return valid
+		game.is_valid_move = counted
+
+		if hasattr(game, "count_moves"):
+			def counted_batch(checked, rejected):
+				self.add("checked_moves", checked)
+				self.add("rejected_moves", rejected)
+			game.count_moves = counted_batch
+			self.wrapped.append("count_moves")
+
+	def timed(self, name, method):
+		def phase(*args, **kwargs):
+			if name.startswith("play_"):
+				self.next_turn()
+			start = perf_counter()
+			result = method(*args, **kwargs)
+			self.add(name, perf_counter() - start, "time")
+			self.add(name, 1, "calls")
+			if name == "trace_boundaries":
+				self.add("traced", len(args[0]))
+				self.add("points", sum(len(p.boundaries) for p in args[0]))
+			elif name == "territory_boundaries":
+				self.add("agent_points", len(result))
+			return result
+		return phase
+
+	def add(self, key, value=1, group="counts"):
+		if self.record is None:
+			self.next_turn()
+		values = self.record[group]
+		values[key] = values.get(key, 0) + value
+
+	def next_turn(self):
+		# the record of a turn ends when the next one is played, boundaries are traced after the turn
+		self.write()
+		self.record = {"turn": self.game.turn, "time": {}, "calls": {}, "counts": {}}
+
+	def write(self):
+		if self.record is not None:
+			self.file.write(json.dumps(self.record) + "\n")
+			self.record = None
+
+	def close(self):
+		self.write()
+		self.file.close()
+		for name in self.wrapped:
+			delattr(self.game, name)
+
+def keyframe_turns(turns, turn_time, every=1, start=0):
+	# turns whose boundaries are traced, by step of every or the last turn of each frame if every is 0
+	if every:
+		return sorted(set(range(start, turns, every)) | {turns - 1})
+	frames = [round((t - start + 1) * turn_time) for t in range(start, turns)] + [None]
+	return [t for t in range(start, turns) if frames[t - start + 1] != frames[t - start]]
+
+def new_battle(grid_width, grid_height, players, n_static, seed, backend="list"):
 	# Initialisation du jeu
 	set_seed(seed)
-	game = GameMap(grid_width, grid_height)
+	game = MAPS[backend](grid_width, grid_height)
 	assert players < game.size
 	static_count = 0
 	for p in range(players):
 		static = static_count < n_static
 		static_count += 1
 		game.spawn_player(p, static)
+	return game
+
+def play_battle(game, turns, keep=None, raw=False, mode="sequential", checkpoint=None, every=0):
+	# Simulation des agents jusqu'au tour turns, les frontières seulement pour les tours gardés
+	keep = None if keep is None else set(keep)
+	play_turn = getattr(game, MODES[mode])
+	for t in range(game.turn, turns):
+		play_turn()
+		game.turn += 1
+		if checkpoint is not None and (game.turn == turns or (every and game.turn % every == 0)):
+			save_checkpoint(game, checkpoint)
+		if keep is None or t in keep:
+			yield game.outlines() if raw else game.compute_boundaries()
+
+def run_agent_battle(grid_width, grid_height, players, n_static, turns, seed, backend="list", keep=None, raw=False,
+                     mode="sequential"):
+	game = new_battle(grid_width, grid_height, players, n_static, seed, backend)
+	yield from play_battle(game, turns, keep, raw, mode)
+
+class BoundaryLog:
+	"""
+	Append-only file of the outlines of kept turns. A header of width, height, players, first and last turns,
+	then by turn: its number, parent ids, offsets of players in a flat buffer of x, y points.
+	"""
+	MAGIC = b"TBL1"
+
+	def __init__(self, path, width, height, players, start, turns):
+		self.file = open(path, "wb")
+		self.file.write(BoundaryLog.MAGIC + np.array([width, height, players, start, turns], dtype=np.int32).tobytes())
+
+	def append(self, turn, parents, points):
+		offsets = np.zeros(len(points) + 1, dtype=np.int64)
+		np.cumsum([len(xy) for xy in points], out=offsets[1:])
+		self.file.write(np.array([turn, len(points)], dtype=np.int32).tobytes())
+		self.file.write(np.array(parents, dtype=np.int32).tobytes())
+		self.file.write(offsets.tobytes())
+		self.file.write(np.concatenate(points).astype(np.float64).tobytes())
+
+	def close(self):
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+def read_log(path, points=True):
+	# header of a boundary log and a generator of its turns, without points they are skipped
+	file = open(path, "rb")
+	if file.read(4) != BoundaryLog.MAGIC:
+		file.close()
+		raise ValueError(f"{path} isn't a boundary log")
+	header = tuple(np.frombuffer(file.read(20), dtype=np.int32).tolist())
+
+	def turns():
+		with file:
+			while len(head := file.read(8)) == 8:
+				turn, n = np.frombuffer(head, dtype=np.int32).tolist()
+				parents = np.frombuffer(file.read(4 * n), dtype=np.int32)
+				offsets = np.frombuffer(file.read(8 * (n + 1)), dtype=np.int64)
+				if points:
+					xy = np.frombuffer(file.read(16 * int(offsets[-1])), dtype=np.float64).reshape(-1, 2)
+				else:
+					file.seek(16 * int(offsets[-1]), os.SEEK_CUR)
+					xy = None
+				yield turn, parents, offsets, xy
+	return header, turns()
+
+def record_battle(path, game, turns, keep=None, mode="sequential", checkpoint=None, every=0):
+	# plays the battle and streams outlines of kept turns without collinear points to a log
+	keep = range(game.turn, turns) if keep is None else keep
+	last = {}  # boundaries that didn't change keep their array
+	with BoundaryLog(path, game.width, game.height, len(game.players), game.turn, turns) as log:
+		battle = play_battle(game, turns, keep=keep, raw=True, mode=mode, checkpoint=checkpoint, every=every)
+		for t, outlines in zip(keep, battle):
+			parents, points = [], []
+			for j, (parent_id, boundaries) in enumerate(outlines):
+				if j not in last or last[j][0] is not boundaries:
+					last[j] = boundaries, simplify(boundaries)
+				parents.append(parent_id)
+				points.append(last[j][1])
+			log.append(t, parents, points)
+
+def render_log(path, fps, duration, fill=True):
+	# svg of a boundary log, a player keeps the points of its largest outline so keyframes don't need a reshape
+	(width, height, players, start, turns), records = read_log(path, points=False)
+	counts = np.zeros(players, dtype=np.int64)
+	for _, _, offsets, _ in records:
+		np.maximum(counts, np.diff(offsets), out=counts)
+	counts = counts.tolist()
+	turn_time = (duration * fps) / (turns - start)
 
-	# Simulation des agents
-	for t in range(turns):
-		game.play_turn()
-		yield game.compute_boundaries()
+	svg = SVG()
+	svg.set_view_box(Point2D(0, 0), Point2D(width, height))
+	polygons, shown = [], [None] * players
+	for t, _, offsets, xy in read_log(path)[1]:
+		for j in range(players):
+			points = xy[offsets[j]:offsets[j + 1]]
+			if shown[j] is None or not np.array_equal(shown[j][0], points):
+				shown[j] = points, [Vector(x, y) for x, y in resample(points, counts[j]).tolist()]
+			if len(polygons) == j:
+				# Add polygon and generate first polygon with animation
+				low, high = points.min(axis=0), points.max(axis=0)
+				p = Polygon([Vector(*((low + high) / 2).tolist())] * counts[j])
+				if not fill:
+					p.set_style(fill_color="none", stroke_width=0.25, custom=False)
+				polygons.append(p)
+				svg.append(p)
+			polygons[j].add_modification(round((t - start + 1) * turn_time), shown[j][1])
+	return svg, width, height
 
 def generate_cli():
 	ap = ArgumentParser(
@@ -358,13 +1006,25 @@ def generate_cli():
 	g.add_argument("-t", "--turns", metavar="INT", type=int,
 	               help="The number of turn to play during battle.", default=10)
 	g.add_argument("-wdt", "--width", metavar="INT", type=int,
-	               help="The width of battle zone.", default=10, choices=range(5, 51))
+	               help="The width of battle zone.", default=10)
 	g.add_argument("-hgt", "--height", metavar="INT", type=int,
-	               help="The height of battle zone.", default=10, choices=range(5, 51))
+	               help="The height of battle zone.", default=10)
 	g.add_argument("-d", "--duration", metavar="INT", type=int,
 	               help="Time in second for the battle. Default 10 seconds.", default=10)
 	g.add_argument("-s", "--seed", metavar="INT", type=int,
 	               help="Seed for initialization of the random number generator for predictable results.", default=None)
+	g.add_argument("-bk", "--backend", metavar="STR", type=str,
+	               help="Storage of the battle map, numpy keeps owner ids in an array for large maps. Default is list.",
+	               default="list", choices=list(MAPS))
+	g.add_argument("-m", "--mode", metavar="STR", type=str,
+	               help="Update rule of turns, synchronous moves all agents at once from the same board and needs "
+	                    "the numpy backend. Default is sequential.", default="sequential", choices=list(MODES))
+	g.add_argument("-rs", "--resume", metavar="FILENAME", type=str,
+	               help="Checkpoint to continue a battle from until its turn --turns, it gives the map, agents and seed.",
+	               default=None)
+	g.add_argument("-ke", "--keep-every", metavar="INT", type=int,
+	               help="Trace boundaries every INT turns, 0 for the last turn of each frame only. "
+	                    "Default is 1, all turns.", default=1)
 
 	g = ap.add_argument_group("Style")
 	g.add_argument("-f", "--fill", metavar="BOOL", type=str, default="True", choices=["True", "False"],
@@ -377,6 +1037,19 @@ def generate_cli():
 	               help="Name of output file.", default="Battle")
 	g.add_argument("-ext", "--extension", metavar="EXTENSION", type=str,
 	               help="Extension of the output file.", default="gif", choices=["gif", "mp4"])
+	g.add_argument("-lg", "--log", metavar="FILENAME", type=str,
+	               help="File where boundaries of the battle are streamed, kept after rendering. "
+	                    "Default is a temporary file.", default=None)
+	g.add_argument("-cp", "--checkpoint", metavar="FILENAME", type=str,
+	               help="File where the state of the battle is saved at its end.", default=None)
+	g.add_argument("-ce", "--checkpoint-every", metavar="INT", type=int,
+	               help="Save the checkpoint every INT turns too. Default is 0, at the end only.", default=0)
+	g.add_argument("-pf", "--profile", metavar="FILENAME", type=str,
+	               help="File where timings and counters of battle phases are written, a json line by turn.",
+	               default=None)
+	g.add_argument("-rp", "--replay", metavar="FILENAME", type=str,
+	               help="Render a boundary log without playing a battle, generation options are ignored.",
+	               default=None)
 
 	g = ap.add_argument_group("Misc")
 	g.add_argument("-v", "--version", action="version", help="show version number and exit",
@@ -386,30 +1059,39 @@ def generate_cli():
 	return ap
 
 def main():
-	args = generate_cli().parse_args()
+	ap = generate_cli()
+	args = ap.parse_args()
+	if args.mode == "synchronous" and args.backend != "numpy":
+		ap.error("synchronous mode needs the numpy backend")
 	fps = args.frame_per_seconds
-	width, height = args.width, args.height
-	turn_time = (args.duration * fps) / args.turns # In seconds
-	polygons = []
-
-	iter_on_battle = run_agent_battle(width, height, players=args.agent, n_static=0, turns=args.turns, seed=args.seed)
-	first_turn = next(iter_on_battle)
-
-	svg = SVG()
-	svg.set_view_box(Point2D(0, 0), Point2D(width, height))
 
-	for poly in first_turn:
-		# Add polygon and generate first polygon with animation
-		p = Polygon([poly.get_center()] * len(poly.points))
-		if args.fill != "True":
-			p.set_style(fill_color="none", stroke_width=0.25, custom=False)
-		p.add_modification(round(turn_time), poly.points)
-		polygons.append(p)
-		svg.append(p)
-
-	for i, turn in enumerate(iter_on_battle):
-		for j, poly in enumerate(turn):
-			polygons[j].add_modification(round((i + 2) * turn_time), poly.points)
+	# The battle streams its boundaries to a log, the render replays it
+	log, temporary = args.replay or args.log, args.replay is None and args.log is None
+	if temporary:
+		fd, log = mkstemp(suffix=".tbl")
+		os.close(fd)
+	try:
+		if args.replay is None:
+			if args.resume is None:
+				game = new_battle(args.width, args.height, args.agent, n_static=0, seed=args.seed, backend=args.backend)
+			else:
+				game = load_checkpoint(args.resume, backend=args.backend)
+			if game.turn >= args.turns:
+				ap.error(f"the battle has already played {game.turn} turns")
+			turn_time = (args.duration * fps) / (args.turns - game.turn)  # In seconds
+			kept = keyframe_turns(args.turns, turn_time, args.keep_every, start=game.turn)
+			probe = None if args.profile is None else Probe(game, args.profile)
+			try:
+				record_battle(log, game, args.turns, keep=kept, mode=args.mode, checkpoint=args.checkpoint,
+				              every=args.checkpoint_every)
+			finally:
+				# records of turns already played are kept when the battle stops on an error
+				if probe is not None:
+					probe.close()
+		svg, width, height = render_log(log, fps, args.duration, fill=args.fill == "True")
+	finally:
+		if temporary:
+			os.remove(log)
 
 	video = Video(svg, width=width * 10, height=height * 10, fps=fps)
 	video.save_movie(name=args.output, ext=args.extension)
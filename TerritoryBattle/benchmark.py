@@ -0,0 +1,307 @@
+# Micro benchmarks of TerritoryBattle internals
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+import os
+import json
+import tempfile
+import tracemalloc
+from random import seed as set_seed
+from time import perf_counter
+from argparse import ArgumentParser
+
+import numpy as np
+
+from TerritoryBattle import GameMap, ArrayMap, keyframe_turns, run_agent_battle, simplify, resample, record_battle, \
+	read_log, new_battle, play_battle, save_checkpoint, load_checkpoint, Probe
+# endregion Imports
+
+def scan_valid_move(self, player, d):
+	# is_valid_move before counts, neighbors of each cell it checks are counted again
+	cells, stride = self.cells, self.stride
+	v, o = self.steps[d], self.steps[(d + 1) % 4]
+	dst = player.position + v
+	target = cells[dst]
+	if target == GameMap.OUTSIDE:
+		return False
+	if target == player.id or target == GameMap.EMPTY:
+		return True
+	if self.occupied[dst]:
+		return False
+	for cell in (dst, dst + o, dst - o, dst + v):
+		cell_owner = cells[cell]
+		if cell_owner >= 0:
+			neighbors_count = (cells[cell - 1] == cell_owner) + (cells[cell + 1] == cell_owner) + \
+			                  (cells[cell - stride] == cell_owner) + (cells[cell + stride] == cell_owner)
+			if neighbors_count <= 2:
+				return False
+	return True
+
+def scan_set_owner(self, cell, player):
+	# set_owner without counts
+	old, new = self.cells[cell], player.id
+	if old == new:
+		return
+	if isinstance(self, ArrayMap) and old == GameMap.EMPTY:
+		self.take(cell)
+	self.cells[cell] = new
+	self.dirty.add(new)
+	if old >= 0:
+		self.dirty.add(old)
+	player.grow(*self.coordinates(cell))
+	for step in self.steps:
+		if self.cells[cell + step] >= 0:
+			self.dirty.add(self.cells[cell + step])
+
+class ScanMap(GameMap):
+	is_valid_move = scan_valid_move
+	set_owner = scan_set_owner
+
+class ScanArrayMap(ArrayMap):
+	is_valid_move = scan_valid_move
+	set_owner = scan_set_owner
+
+def owners(game):
+	return game.labels((0, 0, game.width - 1, game.height - 1))[1:-1, 1:-1].tolist()
+
+def spawn(game_map, side, nb_agents, seed):
+	set_seed(seed)
+	game = game_map(side, side)
+	for p in range(nb_agents):
+		game.spawn_player(p, False)
+	return game
+
+def battle(game_map, side, nb_agents, turns, seed):
+	game = spawn(game_map, side, nb_agents, seed)
+	start = perf_counter()
+	for _ in range(turns):
+		game.play_turn()
+	return game, perf_counter() - start
+
+def bench_turns(nb_agents, turns, seed):
+	# Turns without boundaries, neighbor scans against counts kept by moves
+	side = int((5 * nb_agents) ** 0.5)
+	for name, legacy, counted in [("list", ScanMap, GameMap), ("numpy", ScanArrayMap, ArrayMap)]:
+		legacy_game, legacy_elapsed = battle(legacy, side, nb_agents, turns, seed)
+		game, elapsed = battle(counted, side, nb_agents, turns, seed)
+		same = "same" if owners(game) == owners(legacy_game) else "DIFFERENT"
+		print(f"{name:>8} {nb_agents:>9} agents {side:>5}x{side:<5} scan {turns / legacy_elapsed:10.1f} turns/s "
+		      f"counts {turns / elapsed:10.1f} turns/s {legacy_elapsed / elapsed:6.2f}x {same}")
+
+def bench_boundaries(nb_agents, turns, seed):
+	# Boundaries of each turn, all players traced again against those whose border could change
+	side = int((5 * nb_agents) ** 0.5)
+	for name, game_map in [("list", GameMap), ("numpy", ArrayMap)]:
+		runs = []
+		for everyone in (True, False):
+			game = spawn(game_map, side, nb_agents, seed)
+			elapsed, traced = 0, 0
+			for _ in range(turns):
+				game.play_turn()
+				if everyone:
+					game.dirty.update(range(nb_agents))
+				traced += len(game.dirty)
+				start = perf_counter()
+				polygons = [polygon.points for polygon in game.compute_boundaries()]
+				elapsed += perf_counter() - start
+			runs.append((elapsed, traced, polygons))
+		(all_elapsed, all_traced, all_polygons), (elapsed, traced, polygons) = runs
+		same = "same" if polygons == all_polygons else "DIFFERENT"
+		print(f"{name:>8} {nb_agents:>9} agents {side:>5}x{side:<5} all {turns / all_elapsed:8.1f} turns/s "
+		      f"dirty {turns / elapsed:8.1f} turns/s {traced / turns:9.1f} traced/turn "
+		      f"{all_elapsed / elapsed:6.2f}x {same}")
+
+def bench_contours(nb_agents, turns, seed):
+	# Outlines of all players after some turns, one agent by player against one pass over cracks
+	side = int((5 * nb_agents) ** 0.5)
+	for name, game_map in [("list", GameMap), ("numpy", ArrayMap)]:
+		game, _ = battle(game_map, side, nb_agents, turns, seed)
+		game.compute_topleft_cells()
+		start = perf_counter()
+		agents = [(game.territory_boundaries(p), p.parent) for p in game.players]
+		agent_elapsed = perf_counter() - start
+		start = perf_counter()
+		game.trace_boundaries(game.players)
+		elapsed = perf_counter() - start
+		same = "same" if agents == [(p.boundaries, p.parent) for p in game.players] else "DIFFERENT"
+		print(f"{name:>8} {nb_agents:>9} agents {side:>5}x{side:<5} agents {agent_elapsed:8.3f} s "
+		      f"cracks {elapsed:8.3f} s {agent_elapsed / elapsed:6.2f}x {same}")
+
+def bench_keyframes(nb_agents, turns, seed):
+	# Battle of 50 times the turns on 10 s at 30 fps, boundaries of all turns against one turn by frame
+	side = int((5 * nb_agents) ** 0.5)
+	turns *= 50
+	kept = keyframe_turns(turns, 10 * 30 / turns, 0)
+	runs = []
+	for keep in (None, kept):
+		start = perf_counter()
+		last = None
+		for polygons in run_agent_battle(side, side, nb_agents, 0, turns, seed, backend="numpy", keep=keep):
+			last = [polygon.points for polygon in polygons]
+		runs.append((perf_counter() - start, last))
+	(all_elapsed, all_last), (elapsed, last) = runs
+	same = "same" if last == all_last else "DIFFERENT"
+	print(f"{'frames':>8} {nb_agents:>9} agents {turns:>7} turns all {all_elapsed:8.3f} s "
+	      f"{len(kept):>5} traced {elapsed:8.3f} s {all_elapsed / elapsed:6.2f}x {same}")
+
+def bench_vertices(nb_agents, turns, seed):
+	# Points of the outlines of each turn, one by cell corner against corners only resampled to the largest outline
+	side = int((5 * nb_agents) ** 0.5)
+	outlines = [[boundaries for _, boundaries in game]
+	            for game in run_agent_battle(side, side, nb_agents, 0, turns, seed, backend="numpy", raw=True)]
+	start = perf_counter()
+	simplified = [[simplify(boundaries) for boundaries in turn] for turn in outlines]
+	counts = [max(len(turn[j]) for turn in simplified) for j in range(nb_agents)]
+	resampled = [[resample(xy, counts[j]) for j, xy in enumerate(turn)] for turn in simplified]
+	elapsed = perf_counter() - start
+	raw = sum(len(boundaries) for turn in outlines for boundaries in turn)
+	kept = sum(len(xy) for turn in resampled for xy in turn)
+	# corners are points of the outline and stay after resampling
+	corners = [(set(boundaries), set(map(tuple, xy.tolist())), set(map(tuple, r.tolist())))
+	           for raw_turn, turn, res in zip(outlines, simplified, resampled)
+	           for boundaries, xy, r in zip(raw_turn, turn, res)]
+	same = "same" if all(xy <= boundaries and xy <= r for boundaries, xy, r in corners) else "DIFFERENT"
+	print(f"{'vertices':>8} {nb_agents:>9} agents {side:>5}x{side:<5} raw {raw / turns:10.1f} points/turn "
+	      f"resampled {kept / turns:10.1f} points/turn {raw / kept:6.2f}x in {elapsed:8.3f} s {same}")
+
+def bench_batch(nb_agents, turns, seed):
+	# Turns without boundaries, players one by one against all proposals at once on the numpy map
+	side = int((5 * nb_agents) ** 0.5)
+	runs = []
+	for play in ("play_turn", "play_batch_turn"):
+		game = spawn(ArrayMap, side, nb_agents, seed)
+		start = perf_counter()
+		for _ in range(turns):
+			getattr(game, play)()
+		runs.append((perf_counter() - start, sum(cell >= 0 for cell in game.cells)))
+	(sequential, sequential_owned), (elapsed, owned) = runs
+	print(f"{'batch':>8} {nb_agents:>9} agents {side:>5}x{side:<5} sequential {turns / sequential:8.1f} turns/s "
+	      f"synchronous {turns / elapsed:8.1f} turns/s {sequential / elapsed:6.2f}x "
+	      f"owned {sequential_owned / game.size:5.1%} {owned / game.size:5.1%}")
+
+def bench_log(nb_agents, turns, seed):
+	# Outlines of all turns, kept in memory as points against streamed to a boundary log
+	side = int((5 * nb_agents) ** 0.5)
+	fd, path = tempfile.mkstemp(suffix=".tbl")
+	os.close(fd)
+	runs = []
+	for stream in (False, True):
+		tracemalloc.start()
+		start = perf_counter()
+		if stream:
+			record_battle(path, new_battle(side, side, nb_agents, 0, seed, backend="numpy"), turns)
+		else:
+			history, last = [], {}
+			for outlines in run_agent_battle(side, side, nb_agents, 0, turns, seed, backend="numpy", raw=True):
+				for j, (_, boundaries) in enumerate(outlines):
+					if j not in last or last[j][0] is not boundaries:
+						last[j] = boundaries, simplify(boundaries)
+				history.append([xy for _, xy in last.values()])
+		elapsed = perf_counter() - start
+		runs.append((elapsed, tracemalloc.get_traced_memory()[1]))
+		tracemalloc.stop()
+	_, records = read_log(path)
+	same = "same" if all((xy == np.concatenate(turn)).all() for turn, (_, _, _, xy) in zip(history, records)) \
+		else "DIFFERENT"
+	size = os.path.getsize(path)
+	os.remove(path)
+	(memory_elapsed, memory_peak), (elapsed, peak) = runs
+	print(f"{'log':>8} {nb_agents:>9} agents {turns:>5} turns memory {memory_elapsed:7.3f} s {memory_peak / 2 ** 20:8.1f} MiB "
+	      f"log {elapsed:7.3f} s {peak / 2 ** 20:8.1f} MiB {size / 2 ** 20:8.1f} MiB on disk {same}")
+
+def bench_checkpoint(nb_agents, turns, seed):
+	# Battle state after some turns, played again from the seed against loaded from a checkpoint
+	side = int((5 * nb_agents) ** 0.5)
+	fd, path = tempfile.mkstemp(suffix=".npz")
+	os.close(fd)
+	start = perf_counter()
+	game = new_battle(side, side, nb_agents, 0, seed, backend="numpy")
+	for _ in play_battle(game, turns, keep=()):
+		pass
+	played = perf_counter() - start
+	start = perf_counter()
+	save_checkpoint(game, path)
+	saved = perf_counter() - start
+	start = perf_counter()
+	loaded = load_checkpoint(path, backend="numpy")
+	elapsed = perf_counter() - start
+	size = os.path.getsize(path)
+	os.remove(path)
+	same = "same" if owners(loaded) == owners(game) and \
+		[p.position for p in loaded.players] == [p.position for p in game.players] else "DIFFERENT"
+	print(f"{'resume':>8} {nb_agents:>9} agents {turns:>5} turns play {played:8.3f} s save {saved:7.3f} s "
+	      f"load {elapsed:7.3f} s {played / elapsed:7.2f}x {size / 2 ** 10:9.1f} KiB {same}")
+
+def bench_probe(nb_agents, turns, seed):
+	# Turns with boundaries without and with a probe, time of each phase from the probe
+	side = int((5 * nb_agents) ** 0.5)
+	fd, path = tempfile.mkstemp(suffix=".jsonl")
+	os.close(fd)
+	runs = []
+	for probed in (False, True):
+		game = new_battle(side, side, nb_agents, 0, seed, backend="numpy")
+		probe = Probe(game, path) if probed else None
+		start = perf_counter()
+		for outlines in play_battle(game, turns, raw=True):
+			for _ in outlines:
+				pass
+		runs.append(perf_counter() - start)
+		if probe is not None:
+			probe.close()
+	with open(path) as file:
+		records = [json.loads(line) for line in file]
+	os.remove(path)
+	phases = {}
+	for record in records:
+		for phase, elapsed in record["time"].items():
+			phases[phase] = phases.get(phase, 0) + elapsed
+	shares = " ".join(f"{phase} {elapsed / runs[1]:5.1%}" for phase, elapsed in phases.items())
+	print(f"{'probe':>8} {nb_agents:>9} agents {side:>5}x{side:<5} off {turns / runs[0]:8.1f} turns/s "
+	      f"on {turns / runs[1]:8.1f} turns/s {shares}")
+
+BENCHMARKS = {
+	"turns": bench_turns,
+	"boundaries": bench_boundaries,
+	"contours": bench_contours,
+	"keyframes": bench_keyframes,
+	"vertices": bench_vertices,
+	"batch": bench_batch,
+	"log": bench_log,
+	"checkpoint": bench_checkpoint,
+	"probe": bench_probe,
+}
+
+def generate_cli():
+	ap = ArgumentParser(
+			description="Micro benchmarks of TerritoryBattle internals.",
+			epilog="Report bugs, request features, or provide suggestions via https://github.com/evayann/NiceEffects",
+			add_help=False
+	)
+
+	g = ap.add_argument_group("Benchmark")
+	g.add_argument("-b", "--benchmark", metavar="STR", type=str, nargs="+",
+	               help="Benchmarks to run. Default all.", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+	g.add_argument("-nb", "--agent", metavar="INT", type=int, nargs="+",
+	               help="Number of agents for each run, on a map of 5 cells by agent.", default=[500, 5000])
+	g.add_argument("-t", "--turns", metavar="INT", type=int,
+	               help="The number of turn to play for each run.", default=20)
+	g.add_argument("-s", "--seed", metavar="INT", type=int,
+	               help="Seed for initialization of the random number generator for predictable results.", default=0)
+
+	g = ap.add_argument_group("Misc")
+	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
+	               version=f"%(prog)s V.{__version__}")
+	g.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+	return ap
+
+def main():
+	args = generate_cli().parse_args()
+	for name in args.benchmark:
+		for nb_agents in args.agent:
+			BENCHMARKS[name](nb_agents, args.turns, args.seed)
+
+if __name__ == '__main__':
+	main()
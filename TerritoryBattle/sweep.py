@@ -0,0 +1,146 @@
+# Sweep of TerritoryBattle seeds over processes, summaries and thumbnails to choose battles to render
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+import os
+import sys
+import json
+from time import perf_counter
+from functools import partial
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from TerritoryBattle import MAPS, MODES, new_battle, play_battle, keyframe_turns, record_battle, render_log, Video
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared helpers at the root
+from raster import write_png, thumbnail
+# endregion Imports
+
+def summarize(seed, width, height, agents, turns, backend, mode, kept, output, size):
+	# Battle of a seed with its metrics, boundaries of kept turns are traced as for its video,
+	# parents depend on the turns traced before
+	game = new_battle(width, height, agents, 0, seed, backend)
+	kept, times, traced, parents = set(kept), [], 0.0, []  # no parents without a kept turn
+	start = perf_counter()
+	for t, outlines in enumerate(play_battle(game, turns, keep=range(turns), raw=True, mode=mode)):
+		times.append(perf_counter() - start)
+		start = perf_counter()
+		if t in kept:  # outlines are traced only when read
+			parents = [parent for parent, _ in outlines]
+			traced += perf_counter() - start
+			start = perf_counter()
+
+	grid = game.grid()
+	sizes = np.bincount(grid[grid >= 0], minlength=agents) / game.size
+	depths = []
+	for parent in parents:
+		depth = 0
+		while parent >= 0 and depth < agents:
+			parent, depth = parents[parent], depth + 1
+		depths.append(depth)
+	if size:
+		write_png(f"{output}-{seed}.png", thumbnail(grid, size))
+	return {
+		"seed": seed,
+		"alive": int((sizes > 0).sum()),
+		"owned": float(sizes.sum()),
+		"largest": np.sort(sizes)[::-1][:5].tolist(),
+		"nested": int(sum(depth > 0 for depth in depths)),
+		"depth": max(depths, default=0),
+		"turn_mean": float(np.mean(times)) if times else 0.0,
+		"turn_max": max(times, default=0.0),
+		"traced": traced,
+	}
+
+def render(seed, args, kept):
+	# Full video of a chosen seed, as TerritoryBattle does
+	log = f"{args.output}-{seed}.tbl"
+	game = new_battle(args.width, args.height, args.agent, 0, seed, args.backend)
+	record_battle(log, game, args.turns, keep=kept, mode=args.mode)
+	svg, width, height = render_log(log, args.frame_per_seconds, args.duration)
+	os.remove(log)
+	video = Video(svg, width=width * 10, height=height * 10, fps=args.frame_per_seconds)
+	video.save_movie(name=f"{args.output}-{seed}", ext=args.extension)
+
+def generate_cli():
+	ap = ArgumentParser(
+			description="Play TerritoryBattle seeds in parallel, with metrics and thumbnails to choose the ones to render.",
+			epilog="Report bugs, request features, or provide suggestions via https://github.com/evayann/NiceEffects",
+			add_help=False
+	)
+
+	g = ap.add_argument_group("Generation")
+	g.add_argument("-s", "--seed", metavar="INT", type=int,
+	               help="First seed of the sweep. Default is 0.", default=0)
+	g.add_argument("-c", "--count", metavar="INT", type=int,
+	               help="Number of seeds to play. Default is 16.", default=16)
+	g.add_argument("-nb", "--agent", metavar="INT", type=int,
+	               help="Number of agent in the battle.", default=10)
+	g.add_argument("-t", "--turns", metavar="INT", type=int,
+	               help="The number of turn to play during battle.", default=10)
+	g.add_argument("-wdt", "--width", metavar="INT", type=int,
+	               help="The width of battle zone.", default=10)
+	g.add_argument("-hgt", "--height", metavar="INT", type=int,
+	               help="The height of battle zone.", default=10)
+	g.add_argument("-bk", "--backend", metavar="STR", type=str,
+	               help="Storage of the battle map. Default is list.", default="list", choices=list(MAPS))
+	g.add_argument("-m", "--mode", metavar="STR", type=str,
+	               help="Update rule of turns, synchronous needs the numpy backend. Default is sequential.",
+	               default="sequential", choices=list(MODES))
+	g.add_argument("-ke", "--keep-every", metavar="INT", type=int,
+	               help="Trace boundaries every INT turns, 0 for the last turn of each frame only. "
+	                    "Default is 1, all turns.", default=1)
+	g.add_argument("-w", "--workers", metavar="INT", type=int,
+	               help="Number of processes who play seeds, 0 for all cores. Default is 0.", default=0)
+
+	g = ap.add_argument_group("Output")
+	g.add_argument("-o", "--output", metavar="FILENAME", type=str,
+	               help="Prefix of the summary json, thumbnails and videos, followed by the seed.", default="Sweep")
+	g.add_argument("-ts", "--thumbnail-size", metavar="INT", type=int,
+	               help="Largest side in pixel of thumbnails, 0 for none. Default is 128.", default=128)
+	g.add_argument("-r", "--render", metavar="INT", type=int, nargs="+",
+	               help="Seeds to render as videos instead of sweeping.", default=None)
+	g.add_argument("-d", "--duration", metavar="INT", type=int,
+	               help="Time in second for rendered battles. Default 10 seconds.", default=10)
+	g.add_argument("-fps", "--frame-per-seconds", metavar="INT", type=int,
+	               help="The number of frame per seconds.", default=30)
+	g.add_argument("-ext", "--extension", metavar="EXTENSION", type=str,
+	               help="Extension of rendered videos.", default="gif", choices=["gif", "mp4"])
+
+	g = ap.add_argument_group("Misc")
+	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
+	               version=f"%(prog)s V.{__version__}")
+	g.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+	return ap
+
+def main():
+	ap = generate_cli()
+	args = ap.parse_args()
+	if args.mode == "synchronous" and args.backend != "numpy":
+		ap.error("synchronous mode needs the numpy backend")
+	seeds = args.render or list(range(args.seed, args.seed + args.count))
+	workers = min(args.workers or os.cpu_count(), len(seeds))
+	kept = keyframe_turns(args.turns, (args.duration * args.frame_per_seconds) / args.turns, args.keep_every)
+
+	with ProcessPoolExecutor(workers) as pool:
+		if args.render:
+			list(pool.map(partial(render, args=args, kept=kept), seeds))
+			return
+		play = partial(summarize, width=args.width, height=args.height, agents=args.agent, turns=args.turns,
+		               backend=args.backend, mode=args.mode, kept=kept, output=args.output, size=args.thumbnail_size)
+		summaries = list(pool.map(play, seeds))
+
+	with open(f"{args.output}.json", "w") as f:
+		json.dump(summaries, f, indent=1)
+	print(f"{'seed':>8} {'alive':>6} {'largest':>8} {'nested':>7} {'depth':>6} {'ms/turn':>8} {'traced s':>9}")
+	for summary in summaries:
+		print(f"{summary['seed']:>8} {summary['alive']:>6} {summary['largest'][0]:>8.1%} {summary['nested']:>7} "
+		      f"{summary['depth']:>6} {summary['turn_mean'] * 1000:>8.2f} {summary['traced']:>9.3f}")
+
+if __name__ == '__main__':
+	main()
@@ -5,132 +5,392 @@ __author__ = "Yann Zavattero"
 __version__ = "1"
 
 # region Imports
+import gzip
 import heapq
-from itertools import count
+import io
+import os
+import sys
+from itertools import count, chain
 import math
-from random import seed as set_seed, randint
+from random import seed as set_seed, randint, random, uniform, choice
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 
-from SVGVideoMaker import Point2D as Point, Segment as S, Arc as A
+import numpy as np
+
+from SVGVideoMaker import Point2D as Point, Segment as S
 from SVGVideoMaker import Video as Video
+from SVGVideoMaker.geo.debug import msg, DebugLevel
 from SVGVideoMaker import SVG, save
 from SVGVideoMaker import AnimationType
 from SVGVideoMaker import Rectangle
-# endregion Imports
 
-class Segment:
-	def __init__(self, y, voronoi):
-		self.start = y
-		self.end = None
-		self.done = False
-		self.segment = None
-		self.v = voronoi
-
-	def compute_bound(self, seg):
-		for pt in [seg.intersect_point(bd_seg) for bd_seg in self.v.bounds.get_segments()]: # Get intersection point with segment and 4 segments of bounds
-			if pt:
-				if not self.v.bounds.is_in(seg.endpoints[0]):
-					seg.endpoints[0] = round(pt, 3)
-				elif not self.v.bounds.is_in(seg.endpoints[1]):  # movement endpoints[1]
-					seg.endpoints[1] = round(pt, 3)
-
-	def compute_segment(self):
-		# Round and reorient segment
-		self.start, self.end = round(self.start, 3), round(self.end, 3)
-		seg = S(self.start, self.end) if self.start < self.end else S(self.end, self.start)
-
-		# Crop segment to map to size
-		self.compute_bound(seg)
-		start_frame = int((seg.endpoints[0].x / self.v.width) * self.v.duration)
-		end_frame = int((seg.endpoints[1].x / self.v.width) * self.v.duration)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared helpers at the root
+from raster import parse_color, write_png
+# endregion Imports
 
-		if start_frame != end_frame:
-			# Draw segment by inflation
-			segment = S(seg.endpoints[0], seg.endpoints[0])
-			segment.set_style(stroke_color=self.v.color, stroke_dasharray=self.v.dasharray)
-			segment.animations.add_animation(start_frame, AnimationType.INFLATION, value=Point(0, 0))
+class Vertex:
+	# Plain 2D position used by the sweep, SVG points are only built for output
+	__slots__ = ("x", "y")
 
-			movement = seg.endpoints[1] - seg.endpoints[0]
-			segment.animations.add_animation(end_frame, AnimationType.INFLATION, value=movement)
-			if self.v.bounds.is_in(segment.endpoints[0]) and \
-					self.v.bounds.is_in(segment.endpoints[1]):
-				self.v.last_frame = max(self.v.last_frame, end_frame)
-		else:
-			# Draw segment by pop
-			segment = S(seg.endpoints[0], seg.endpoints[1], opacity=0)
-			segment.set_style(stroke_color="blue")
-			segment.add_opacity(start_frame - 1 if start_frame > 0 else 0, 0)
-			segment.add_opacity(end_frame, 1)
+	def __init__(self, x, y):
+		self.x = x
+		self.y = y
 
-		self.segment = segment
+class Segment:
+	# Half-edge of the diagram between sites p0 and p1, its animation is computed at output time
+	__slots__ = ("start", "end", "done", "p0", "p1")
 
-	def set_end(self, end, is_finish):
-		self.end = end
-		self.done = is_finish
-		self.compute_segment()
+	def __init__(self, start, p0=None, p1=None):
+		self.start = start
+		self.end = None
+		self.done = False
+		self.p0 = p0
+		self.p1 = p1
 
 	def finish(self, p):
 		if self.done:
 			return
-		self.set_end(p, True)
-
-	def get_segment(self):
-		return self.segment
+		self.end = p
+		self.done = True
 
 class Event:
+	__slots__ = ("x", "p", "a", "valid")
+
 	def __init__(self, x, p, a):
 		self.x = x
 		self.p = p
 		self.a = a
 		self.valid = True
 
-class Arc(A):
+class Arc:
+	__slots__ = ("p", "pprev", "pnext", "e", "s0", "s1", "left", "right", "parent", "red")
+
 	def __init__(self, p, a=None, b=None):
-		super().__init__(0, 0, 0)
 		self.p = p
 		self.pprev = a
 		self.pnext = b
 		self.e = None
 		self.s0 = None
 		self.s1 = None
+		# red-black tree links, managed by Beachline
+		self.left = None
+		self.right = None
+		self.parent = None
+		self.red = False
+
+class Beachline:
+	# Red-black tree over the arcs, its in-order walk is the pprev/pnext list.
+	# Arcs are never compared by key, position in the tree is given at insertion
+	# and the lookup computes breakpoints at the current sweep position.
+	def __init__(self):
+		self.nil = Arc(None)
+		self.root = self.nil
+
+	def empty(self):
+		return self.root is self.nil
+
+	def find(self, y, breakpoint, l):
+		# first arc whose upper breakpoint at sweep position l is at or above y
+		node, found = self.root, None
+		while node is not self.nil:
+			if node.pnext is None or y <= breakpoint(node.p, node.pnext.p, l):
+				found = node
+				node = node.left
+			else:
+				node = node.right
+		return found
+
+	def insert_first(self, arc):
+		arc.left = arc.right = self.nil
+		arc.parent = self.nil
+		arc.red = False
+		self.root = arc
+
+	def insert_after(self, node, arc):
+		arc.left = arc.right = self.nil
+		arc.red = True
+		if node.right is self.nil:
+			node.right = arc
+		else:
+			node = self.minimum(node.right)
+			node.left = arc
+		arc.parent = node
+		self.insert_fixup(arc)
+
+	def last(self):
+		node = self.root
+		while node.right is not self.nil:
+			node = node.right
+		return node
+
+	def minimum(self, node):
+		while node.left is not self.nil:
+			node = node.left
+		return node
+
+	def rotate_left(self, x):
+		y = x.right
+		x.right = y.left
+		if y.left is not self.nil:
+			y.left.parent = x
+		y.parent = x.parent
+		if x.parent is self.nil:
+			self.root = y
+		elif x is x.parent.left:
+			x.parent.left = y
+		else:
+			x.parent.right = y
+		y.left = x
+		x.parent = y
+
+	def rotate_right(self, x):
+		y = x.left
+		x.left = y.right
+		if y.right is not self.nil:
+			y.right.parent = x
+		y.parent = x.parent
+		if x.parent is self.nil:
+			self.root = y
+		elif x is x.parent.right:
+			x.parent.right = y
+		else:
+			x.parent.left = y
+		y.right = x
+		x.parent = y
+
+	def insert_fixup(self, z):
+		while z.parent.red:
+			grand = z.parent.parent
+			if z.parent is grand.left:
+				uncle = grand.right
+				if uncle.red:
+					z.parent.red = uncle.red = False
+					grand.red = True
+					z = grand
+				else:
+					if z is z.parent.right:
+						z = z.parent
+						self.rotate_left(z)
+					z.parent.red = False
+					z.parent.parent.red = True
+					self.rotate_right(z.parent.parent)
+			else:
+				uncle = grand.left
+				if uncle.red:
+					z.parent.red = uncle.red = False
+					grand.red = True
+					z = grand
+				else:
+					if z is z.parent.left:
+						z = z.parent
+						self.rotate_right(z)
+					z.parent.red = False
+					z.parent.parent.red = True
+					self.rotate_left(z.parent.parent)
+		self.root.red = False
+
+	def transplant(self, u, v):
+		if u.parent is self.nil:
+			self.root = v
+		elif u is u.parent.left:
+			u.parent.left = v
+		else:
+			u.parent.right = v
+		v.parent = u.parent
+
+	def remove(self, z):
+		y, y_red = z, z.red
+		if z.left is self.nil:
+			x = z.right
+			self.transplant(z, z.right)
+		elif z.right is self.nil:
+			x = z.left
+			self.transplant(z, z.left)
+		else:
+			y = self.minimum(z.right)
+			y_red = y.red
+			x = y.right
+			if y.parent is z:
+				x.parent = y
+			else:
+				self.transplant(y, y.right)
+				y.right = z.right
+				y.right.parent = y
+			self.transplant(z, y)
+			y.left = z.left
+			y.left.parent = y
+			y.red = z.red
+		if not y_red:
+			self.remove_fixup(x)
+		z.left = z.right = z.parent = None
+
+	def remove_fixup(self, x):
+		while x is not self.root and not x.red:
+			if x is x.parent.left:
+				w = x.parent.right
+				if w.red:
+					w.red = False
+					x.parent.red = True
+					self.rotate_left(x.parent)
+					w = x.parent.right
+				if not w.left.red and not w.right.red:
+					w.red = True
+					x = x.parent
+				else:
+					if not w.right.red:
+						w.left.red = False
+						w.red = True
+						self.rotate_right(w)
+						w = x.parent.right
+					w.red = x.parent.red
+					x.parent.red = False
+					w.right.red = False
+					self.rotate_left(x.parent)
+					x = self.root
+			else:
+				w = x.parent.left
+				if w.red:
+					w.red = False
+					x.parent.red = True
+					self.rotate_right(x.parent)
+					w = x.parent.left
+				if not w.right.red and not w.left.red:
+					w.red = True
+					x = x.parent
+				else:
+					if not w.left.red:
+						w.right.red = False
+						w.red = True
+						self.rotate_left(w)
+						w = x.parent.left
+					w.red = x.parent.red
+					x.parent.red = False
+					w.left.red = False
+					self.rotate_right(x.parent)
+					x = self.root
+		x.red = False
+
+class SiteQueue:
+	# All sites are known before the sweep, sort them once and walk the array.
+	# Sites sharing the same x must reach the beachline ordered on y.
+	# Sites of a (n, 2) array become vertices by chunks when the sweep reaches them.
+	def __init__(self, points, chunk=1 << 16):
+		if isinstance(points, np.ndarray):
+			order = np.lexsort((points[:, 1], points[:, 0]))
+			xs, ys = points[order, 0], points[order, 1]
+			# check for duplicate
+			keep = np.ones(len(xs), dtype=bool)
+			keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+			self.xs = np.ascontiguousarray(xs[keep], dtype=np.float64)
+			self.ys = np.ascontiguousarray(ys[keep], dtype=np.float64)
+			self.pq = []
+		else:
+			self.pq = []
+			for point in sorted(points, key=lambda pt: (pt.x, pt.y)):
+				# check for duplicate
+				if not self.pq or self.pq[-1].x != point.x or self.pq[-1].y != point.y:
+					self.pq.append(point)
+			self.xs = np.array([point.x for point in self.pq], dtype=np.float64)
+			self.ys = np.array([point.y for point in self.pq], dtype=np.float64)
+		self.size = len(self.xs)
+		self.chunk = chunk
+		self.index = 0
+
+	def __len__(self):
+		return self.size
+
+	def fill(self, end):
+		# make vertices of sites up to end, at least one chunk at once
+		start = len(self.pq)
+		end = min(self.size, max(end, start + self.chunk))
+		self.pq.extend(map(Vertex, self.xs[start:end].tolist(), self.ys[start:end].tolist()))
+
+	def pop(self):
+		if self.index >= len(self.pq):
+			if self.index >= self.size:
+				raise KeyError('pop from an empty site queue')
+			self.fill(self.index + 1)
+		item = self.pq[self.index]
+		self.index += 1
+		return item
 
-class PriorityQueue:
+	def top(self):
+		if self.index >= len(self.pq):
+			if self.index >= self.size:
+				raise KeyError('top from an empty site queue')
+			self.fill(self.index + 1)
+		return self.pq[self.index]
+
+	def empty(self):
+		return self.index >= self.size
+
+class EventQueue:
+	# Binary heap of (x, seq, id) keys, id is the slot of the event in items.
+	# Invalid events stay in the heap until they reach the head or until they
+	# are the majority, then they are purged in one pass.
 	def __init__(self):
 		self.pq = []
-		self.entry_finder = {}
+		self.items = []
+		self.free = []
 		self.counter = count()
+		self.invalid = 0
 
 	def push(self, item):
-		# check for duplicate
-		if item in self.entry_finder:
-			return
 		# use x-coordinate as a primary key (heapq in python is min-heap)
-		entry = [item.x, next(self.counter), item]
-		self.entry_finder[item] = entry
-		heapq.heappush(self.pq, entry)
+		if self.free:
+			slot = self.free.pop()
+			self.items[slot] = item
+		else:
+			slot = len(self.items)
+			self.items.append(item)
+		heapq.heappush(self.pq, (item.x, next(self.counter), slot))
+
+	def invalidate(self, item):
+		if item.valid:
+			item.valid = False
+			self.invalid += 1
+			if self.invalid > 64 and 2 * self.invalid > len(self.pq):
+				self.purge()
+
+	def purge(self):
+		# remove all invalid events at once and rebuild the heap
+		keep = []
+		for key in self.pq:
+			if self.items[key[2]].valid:
+				keep.append(key)
+			else:
+				self.release(key[2])
+		heapq.heapify(keep)
+		self.pq = keep
+		self.invalid = 0
+
+	def release(self, slot):
+		self.items[slot] = None
+		self.free.append(slot)
 
-	def remove_entry(self, item):
-		entry = self.entry_finder.pop(item)
-		entry[-1] = 'Removed'
+	def discard_invalid_head(self):
+		while self.pq and not self.items[self.pq[0][2]].valid:
+			self.release(heapq.heappop(self.pq)[2])
+			self.invalid -= 1
 
 	def pop(self):
-		while self.pq:
-			_, _, item = heapq.heappop(self.pq)
-			if item != 'Removed':
-				del self.entry_finder[item]
-				return item
-		raise KeyError('pop from an empty priority queue')
+		self.discard_invalid_head()
+		if not self.pq:
+			raise KeyError('pop from an empty priority queue')
+		slot = heapq.heappop(self.pq)[2]
+		item = self.items[slot]
+		self.release(slot)
+		return item
 
 	def top(self):
-		while self.pq:
-			_, _, item = heapq.heappop(self.pq)
-			if item != 'Removed':
-				del self.entry_finder[item]
-				self.push(item)
-				return item
-		raise KeyError('top from an empty priority queue')
+		self.discard_invalid_head()
+		if not self.pq:
+			raise KeyError('top from an empty priority queue')
+		return self.items[self.pq[0][2]]
 
 	def empty(self):
+		self.discard_invalid_head()
 		return not self.pq
 
 class Line:
@@ -149,55 +409,478 @@ class Line:
 	def get_line(self):
 		return self.line
 
+def shift(array, dx, dy, fill):
+	# shifted[y, x] = array[y + dy, x + dx], fill outside of array
+	shifted = np.full_like(array, fill)
+	height, width = array.shape
+	shifted[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)] = \
+		array[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+	return shifted
+
+def liang_barsky(edges, width, height):
+	# Parameters of the part of each edge inside the map, edges are rows of x0, y0, x1, y1
+	x0, y0 = edges[:, 0], edges[:, 1]
+	dx, dy = edges[:, 2] - x0, edges[:, 3] - y0
+	t0, t1 = np.zeros(len(edges)), np.ones(len(edges))
+	keep = np.ones(len(edges), dtype=bool)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		for p, q in [(-dx, x0), (dx, width - x0), (-dy, y0), (dy, height - y0)]:
+			r = q / p
+			keep &= (p != 0) | (q >= 0)
+			t0 = np.where(p < 0, np.maximum(t0, r), t0)
+			t1 = np.where(p > 0, np.minimum(t1, r), t1)
+	keep &= t0 <= t1
+	return keep, t0, t1
+
+def orientation(ax, ay, bx, by, cx, cy):
+	# positive when a, b, c turn counterclockwise, works on floats and arrays
+	return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+def in_circle(ax, ay, bx, by, cx, cy, dx, dy):
+	# positive when d is inside the circle of the counterclockwise triangle a, b, c
+	ax, ay, bx, by, cx, cy = ax - dx, ay - dy, bx - dx, by - dy, cx - dx, cy - dy
+	return ((ax * ax + ay * ay) * (bx * cy - cx * by)
+	        - (bx * bx + by * by) * (ax * cy - cx * ay)
+	        + (cx * cx + cy * cy) * (ax * by - bx * ay))
+
+def circumcenter(ax, ay, bx, by, cx, cy):
+	bx, by, cx, cy = bx - ax, by - ay, cx - ax, cy - ay
+	d = 2 * (bx * cy - by * cx)
+	b, c = bx * bx + by * by, cx * cx + cy * cy
+	return ax + (cy * b - by * c) / d, ay + (bx * c - cx * b) / d
+
+def skyline(xs, ys, nb_bins=1024):
+	# Sites sorted on x are cut in bins of x, each bin keeps its first site, its lowest and highest y
+	bins = np.linspace(xs[0], xs[-1], nb_bins + 1)
+	starts = np.searchsorted(xs, bins, side="left")
+	starts[-1] = len(xs)
+	low, high = np.full(nb_bins, np.inf), np.full(nb_bins, -np.inf)
+	full = starts[:-1] < starts[1:]
+	low[full] = np.minimum.reduceat(ys, starts[:-1][full])
+	high[full] = np.maximum.reduceat(ys, starts[:-1][full])
+	return xs, ys, bins, starts, low, high
+
+def unswept(outline, swept, first, hit):
+	# Sites which aren't in the sweep of the bins selected by hit, hit starts at bin first
+	xs, ys, _, starts, _, _ = outline
+	bins = (np.nonzero(hit)[0] + first).tolist()
+	if not bins:
+		return xs[:0], ys[:0]
+	index = np.concatenate([np.arange(starts[j], starts[j + 1]) for j in bins])
+	index = index[~swept[index]]
+	return xs[index], ys[index]
+
+def empty_disk(px, py, r, outline, swept, boxes):
+	# True when no site out of the sweep is in the disk of center p and radius r. Sites out
+	# of the sweep are all in boxes, disks far from them are empty, for the other ones only
+	# sites of bins whose rectangle meets the disk are checked
+	empty = np.ones(len(px), dtype=bool)
+	for x0, y0, x1, y1 in boxes:
+		empty &= (np.clip(px, x0, x1) - px) ** 2 + (np.clip(py, y0, y1) - py) ** 2 > r * r
+	_, _, bins, _, low, high = outline
+	for i in np.nonzero(~empty)[0].tolist():
+		x, y, radius = px[i], py[i], r[i] * r[i] * (1 + 1e-12)
+		first = max(0, np.searchsorted(bins, x - r[i], side="right") - 1)
+		last = min(len(low), np.searchsorted(bins, x + r[i], side="left"))
+		x0, x1 = bins[first:last], bins[first + 1:last + 1]
+		y0, y1 = low[first:last], high[first:last]
+		full = y0 <= y1
+		cx, cy = np.clip(x, x0, x1), np.clip(y, np.where(full, y0, y), np.where(full, y1, y))
+		hit = full & ((cx - x) ** 2 + (cy - y) ** 2 <= radius)
+		sx, sy = unswept(outline, swept, first, hit)
+		empty[i] = not ((sx - x) ** 2 + (sy - y) ** 2 <= radius).any()
+	return empty
+
+def empty_half_plane(ax, ay, bx, by, ex, ey, outline, swept):
+	# True when no site out of the sweep is strictly on the side of line ab where e is
+	_, _, bins, _, low, high = outline
+	full = low <= high
+	empty = np.ones(len(ax), dtype=bool)
+	for i in range(len(ax)):
+		nx, ny = ay[i] - by[i], bx[i] - ax[i]
+		if nx * (ex[i] - ax[i]) + ny * (ey[i] - ay[i]) < 0:
+			nx, ny = -nx, -ny
+		# a bin crosses the half plane when the farthest corner of its rectangle along the normal does
+		cx = np.where(nx > 0, bins[1:], bins[:-1])
+		cy = np.where(full, np.where(ny > 0, high, low), ay[i])
+		hit = full & (nx * (cx - ax[i]) + ny * (cy - ay[i]) > 0)
+		sx, sy = unswept(outline, swept, 0, hit)
+		empty[i] = not (nx * (sx - ax[i]) + ny * (sy - ay[i]) > 0).any()
+	return empty
+
+def sweep_sites(outline, index, bbox, start, end, boxes, wide=0):
+	# Sweep of some sites, only the edges starting in [start, end) which are the same in
+	# the diagram of all sites are returned, with their sites and endpoint degrees.
+	# All sites out of the sweep must be in boxes. With wide, only open edges and edges
+	# with an empty circle wider than it are returned.
+	xs, ys = outline[0], outline[1]
+	points = [Vertex(x, y) for x, y in zip(xs[index].tolist(), ys[index].tolist())]
+	vg = VoronoiGenerator(0, 0, 0, None, 0, len(points), 0, False, None, False, points=points)
+	vg.x0, vg.y0, vg.x1, vg.y1 = bbox
+	vg.process()
+	swept = np.zeros(len(xs), dtype=bool)
+	swept[index] = True
+
+	# edges still open at the end of the sweep are cut at an arbitrary far point
+	unbounded = set()
+	i = vg.arc
+	while i.pnext is not None:
+		unbounded.add(id(i.s1))
+		i = i.pnext
+
+	site = {id(point): j for j, point in zip(index.tolist(), points)}
+	edges = np.array([(o.start.x, o.start.y, o.end.x, o.end.y) for o in vg.output], dtype=np.float64).reshape(-1, 4)
+	sites = np.array([(site[id(o.p0)], site[id(o.p1)]) for o in vg.output], dtype=np.int64).reshape(-1, 2)
+	opened = np.array([(o.start.x <= vg.x0, id(o) in unbounded) for o in vg.output], dtype=bool).reshape(-1, 2)
+
+	# number of half-edges meeting at each endpoint
+	_, inverse, counts = np.unique(edges.reshape(-1, 2), axis=0, return_inverse=True, return_counts=True)
+	degrees = counts[inverse.ravel()].reshape(-1, 2)
+
+	keep = (edges[:, 0] >= start) & (edges[:, 0] < end)
+	if wide:
+		sx, sy = xs[sites[:, 0]], ys[sites[:, 0]]
+		r = np.maximum(np.hypot(edges[:, 0] - sx, edges[:, 1] - sy), np.hypot(edges[:, 2] - sx, edges[:, 3] - sy))
+		keep &= (r > wide) | opened.any(axis=1)
+	edges, sites, degrees, opened = edges[keep], sites[keep], degrees[keep], opened[keep]
+	for j in (0, 1):
+		# an endpoint is right when its empty circle has no site out of the sweep,
+		# an open end also needs the half plane past its sites to be empty
+		sx, sy = xs[sites[:, 0]], ys[sites[:, 0]]
+		px, py = edges[:, 2 * j], edges[:, 2 * j + 1]
+		keep = empty_disk(px, py, np.hypot(px - sx, py - sy), outline, swept, boxes)
+		o = np.nonzero(opened[:, j] & keep)[0]
+		if len(o):
+			tx, ty = xs[sites[o, 1]], ys[sites[o, 1]]
+			keep[o] = empty_half_plane(sx[o], sy[o], tx, ty, px[o], py[o], outline, swept)
+		edges, sites, degrees, opened = edges[keep], sites[keep], degrees[keep], opened[keep]
+	return edges, sites, degrees
+
+def generate_sites(nb_pts, width, height, seed=None, generator="random", distribution="uniform", spacing=0):
+	# random draws a site after the other as always, numpy draws them all at once
+	set_seed(seed)
+	if distribution == "poisson":
+		# a full Poisson disk sampling has about 0.64 site by square of spacing
+		spacing = spacing or math.sqrt(0.64 * width * height / max(nb_pts, 1))
+		return poisson_sites(width, height, spacing, seed)
+	if generator == "numpy":
+		rng = np.random.default_rng(seed)
+		return rng.integers(0, (width + 1, height + 1), size=(nb_pts, 2)).astype(np.float64)
+	return np.array([(randint(0, width), randint(0, height)) for _ in range(nb_pts)], dtype=np.float64).reshape(-1, 2)
+
+def poisson_sites(width, height, spacing, seed=None, tries=30, batch=1 << 14):
+	# Bridson sampling on a grid of cells holding at most one site, spacing / sqrt(2) wide.
+	# Candidates are checked by batches, those too near of another one of the batch with
+	# a lower random priority wait for the next batch. Random darts on the whole map give
+	# the first active sites, then candidates are drawn around active sites until all
+	# their tries fail.
+	rng = np.random.default_rng(seed)
+	r2 = spacing * spacing
+	cell = spacing / math.sqrt(2)
+	nx, ny = int(width / cell) + 1, int(height / cell) + 1
+	grid = np.full((ny + 4, nx + 4), -1, dtype=np.int64)  # 2 more cells on each side
+	sx, sy = np.empty(nx * ny + 1), np.empty(nx * ny + 1)
+	sx[-1] = sy[-1] = np.inf  # site of empty cells
+	count = 0
+	# the cell of a candidate first, most of them are rejected there
+	rings = [[(0, 0)], [(di, dj) for dj in range(-1, 2) for di in range(-1, 2) if di or dj],
+	         [(di, dj) for dj in range(-2, 3) for di in range(-2, 3) if max(abs(di), abs(dj)) == 2 and min(abs(di), abs(dj)) < 2]]
+
+	def accept(x, y):
+		nonlocal count
+		c = np.nonzero((x >= 0) & (x <= width) & (y >= 0) & (y <= height))[0]
+		i, j = (x[c] / cell).astype(np.int64) + 2, (y[c] / cell).astype(np.int64) + 2
+		for ring in rings:
+			free = np.ones(len(c), dtype=bool)
+			for di, dj in ring:
+				other = grid[j + dj, i + di]
+				free &= (sx[other] - x[c]) ** 2 + (sy[other] - y[c]) ** 2 >= r2
+			c, i, j = c[free], i[free], j[free]
+		tried = np.zeros(len(x), dtype=bool)
+		tried[c] = True
+
+		# among candidates of the batch, the lowest priority of a cell, then of its neighbours
+		shuffle = rng.permutation(len(c))
+		c, i, j = c[shuffle], i[shuffle], j[shuffle]
+		_, first = np.unique(j * (nx + 4) + i, return_index=True)
+		c, i, j = c[first], i[first], j[first]
+		rank = np.zeros(len(x), dtype=np.int64)
+		rank[c] = shuffle[first]
+		grid[j, i] = -2 - c
+		win = np.ones(len(c), dtype=bool)
+		for di, dj in rings[1] + rings[2]:
+			other = -2 - grid[j + dj, i + di]
+			near = other >= 0
+			other = np.where(near, other, 0)
+			win &= ~(near & ((x[other] - x[c]) ** 2 + (y[other] - y[c]) ** 2 < r2) & (rank[other] < rank[c]))
+		grid[j, i] = -1
+		c, i, j = c[win], i[win], j[win]
+		grid[j, i] = np.arange(count, count + len(c))
+		sx[count:count + len(c)], sy[count:count + len(c)] = x[c], y[c]
+		count += len(c)
+		return tried
+
+	for _ in range(4):
+		accept(rng.uniform(0, width, nx * ny // 4), rng.uniform(0, height, nx * ny // 4))
+
+	active = np.arange(count)
+	while len(active):
+		now, active = active[:batch], active[batch:]
+		angle = rng.uniform(0, 2 * math.pi, (len(now), tries))
+		radius = spacing * np.sqrt(rng.uniform(1, 4, (len(now), tries)))
+		x = (sx[now, None] + radius * np.cos(angle)).ravel()
+		y = (sy[now, None] + radius * np.sin(angle)).ravel()
+		first = count
+		free = accept(x, y)
+		# sites with a free candidate stay active, new ones too
+		again = now[free.reshape(len(now), tries).any(axis=1)]
+		active = np.concatenate([active, again, np.arange(first, count)])
+	return np.column_stack([sx[:count], sy[:count]])
+
+def load_sites(name):
+	# .npy files or raw float64 x, y pairs, both mapped without copy
+	if name.endswith(".npy"):
+		sites = np.load(name, mmap_mode="r")
+	else:
+		sites = np.memmap(name, dtype=np.float64, mode="r")
+	return sites.reshape(-1, 2)
+
+class Topology:
+	# Half-edge structure of a processed diagram, built from the two sites of each edge.
+	# Half-edge h goes from vertex origin[h] to origin[h ^ 1], its twin, with the cell of
+	# site cell[h] on its left. Cells are in the order of the sorted sites.
+	def __init__(self, vg):
+		vg.points.fill(len(vg.points))
+		self.sites = np.column_stack([vg.points.xs, vg.points.ys])
+		raw = np.fromiter(chain.from_iterable((o.start.x, o.start.y, o.end.x, o.end.y, o.p0.x, o.p0.y, o.p1.x, o.p1.y)
+		                                      for o in vg.output), dtype=np.float64, count=8 * len(vg.output)).reshape(-1, 8)
+		raw = raw[(raw[:, 0] != raw[:, 2]) | (raw[:, 1] != raw[:, 3])]  # edges of cocircular sites
+
+		# sites are sorted on x then y like complex numbers
+		keys = vg.points.xs + 1j * vg.points.ys
+		p0 = np.searchsorted(keys, raw[:, 4] + 1j * raw[:, 5])
+		p1 = np.searchsorted(keys, raw[:, 6] + 1j * raw[:, 7])
+		vertices, origin = np.unique(raw[:, 0:4:2].ravel() + 1j * raw[:, 1:4:2].ravel(), return_inverse=True)
+		self.vertices = np.column_stack([vertices.real, vertices.imag])
+
+		# the edge is on the bisector of its sites, p0 is on its left when it turns from it to p0 - p1
+		left = (raw[:, 2] - raw[:, 0]) * (raw[:, 5] - raw[:, 7]) - (raw[:, 3] - raw[:, 1]) * (raw[:, 4] - raw[:, 6]) > 0
+		cell = np.empty(len(origin), dtype=np.int64)
+		cell[0::2] = np.where(left, p0, p1)
+		cell[1::2] = np.where(left, p1, p0)
+
+		# the next half-edge of a cell leaves the end of the previous one, chains of unbounded cells end
+		n, nb_sites = len(origin), len(self.sites)
+		twin = np.arange(n) ^ 1
+		keys = cell * len(self.vertices) + origin
+		sort = np.argsort(keys)
+		found = np.searchsorted(keys, cell * len(self.vertices) + origin[twin], sorter=sort).clip(max=n - 1)
+		self.next = np.where(keys[sort[found]] == cell * len(self.vertices) + origin[twin], sort[found], -1)
+		self.unbounded = np.zeros(nb_sites, dtype=bool)
+		self.unbounded[cell[self.next < 0]] = True
+
+		# half-edges of a convex cell turn counterclockwise around its site, a chain starts the cell
+		angle = np.arctan2(self.vertices[origin, 1] - self.sites[cell, 1], self.vertices[origin, 0] - self.sites[cell, 0])
+		order = np.argsort(cell * 8.0 + angle)
+		count = np.bincount(cell, minlength=nb_sites)
+		start = np.concatenate([[0], np.cumsum(count)])
+		pos = np.arange(n) - start[cell[order]]
+		head = np.ones(n, dtype=bool)
+		head[self.next[self.next >= 0]] = False
+		first = np.zeros(nb_sites, dtype=np.int64)
+		first[cell[order[head[order]]]] = pos[head[order]]
+		rank = (pos - first[cell[order]]) % count[cell[order]]
+		order = order[np.argsort(start[cell[order]] + rank)]
+		self.origin, self.cell, self.cell_start, self.cell_edges = origin, cell, start, order
+
+		# Delaunay neighbours in counterclockwise order, an edge cut by a site event is seen twice
+		neighbour = cell[twin[order]]
+		_, keep = np.unique(cell[order] * nb_sites + neighbour, return_index=True)
+		keep.sort()
+		self.neighbour_start = np.concatenate([[0], np.cumsum(np.bincount(cell[order[keep]], minlength=nb_sites))])
+		self.neighbours = neighbour[keep]
+
+		# Delaunay triangles are fans of the cells around vertices of degree 3 or more,
+		# the half-edge after the twin of one leaving a vertex is the next one around it
+		degree = np.bincount(origin, minlength=len(self.vertices))
+		around = np.full(len(self.vertices), -1)
+		around[origin[::-1]] = np.arange(n)[::-1]
+		around = around[degree >= 3]
+		fan, turn = around, self.next[twin[around]]
+		triangles = []
+		for _ in range(degree.max(initial=0) - 2):
+			after = self.next[twin[turn.clip(min=0)]]
+			ok = (turn >= 0) & (after >= 0) & (after != fan)
+			triangles.append(np.column_stack([cell[fan[ok]], cell[turn[ok]], cell[after[ok]]]))
+			fan, turn = fan[ok], after[ok]
+		triangles = np.concatenate(triangles) if triangles else np.empty((0, 3), dtype=np.int64)
+		x, y = self.sites[triangles, 0], self.sites[triangles, 1]
+		cw = orientation(x[:, 0], y[:, 0], x[:, 1], y[:, 1], x[:, 2], y[:, 2]) < 0
+		triangles[cw] = triangles[cw][:, [0, 2, 1]]
+		self.triangles = triangles
+
+	def polygon(self, i):
+		# vertices of cell i counterclockwise, each chain of an unbounded cell ends at its far end
+		edges = self.cell_edges[self.cell_start[i]:self.cell_start[i + 1]]
+		index = np.column_stack([self.origin[edges], np.where(self.next[edges] < 0, self.origin[edges ^ 1], -1)])
+		return self.vertices[index[index >= 0]]
+
+	def neighbours_of(self, i):
+		return self.neighbours[self.neighbour_start[i]:self.neighbour_start[i + 1]]
+
+class SiteGrid:
+	# Uniform grid of buckets of about two sites for nearest site queries. Sites are stored
+	# by bucket, so a row of buckets is a run of sites. The 9 buckets around a query mostly
+	# hold its nearest site, other queries go down a pyramid of bounding boxes of 2 x 2 blocks.
+	def __init__(self, xs, ys, per_bucket=2):
+		self.x0, self.y0 = xs.min(), ys.min()
+		w, h = xs.max() - self.x0, ys.max() - self.y0
+		self.size = max(math.sqrt(max(w, 1) * max(h, 1) * per_bucket / len(xs)), 1e-9)
+		self.nx, self.ny = int(w / self.size) + 1, int(h / self.size) + 1
+		i, j = self.cells(xs, ys)
+		self.order = np.argsort(j * self.nx + i, kind="stable")
+		counts = np.bincount(j * self.nx + i, minlength=self.nx * self.ny)
+		self.start = np.concatenate([[0], np.cumsum(counts)])
+
+		# boxes of the sites of each bucket, empty ones can't be reached
+		full = counts > 0
+		first = self.start[:-1][full]
+		boxes = np.empty((4, self.nx * self.ny))
+		boxes[:2], boxes[2:] = np.inf, -np.inf
+		for k, (coords, reduce) in enumerate([(xs, np.minimum), (ys, np.minimum), (xs, np.maximum), (ys, np.maximum)]):
+			boxes[k, full] = reduce.reduceat(coords[self.order], first)
+		self.levels = [boxes.reshape(4, self.ny, self.nx)]
+		while self.levels[-1].shape[1] > 1 or self.levels[-1].shape[2] > 1:
+			boxes = self.levels[-1]
+			_, ny, nx = boxes.shape
+			padded = np.empty((4, ny + ny % 2, nx + nx % 2))
+			padded[:2], padded[2:] = np.inf, -np.inf
+			padded[:, :ny, :nx] = boxes
+			padded = padded.reshape(4, (ny + 1) // 2, 2, (nx + 1) // 2, 2)
+			self.levels.append(np.concatenate([padded[:2].min(axis=(2, 4)), padded[2:].max(axis=(2, 4))]))
+
+		# one more site at infinity pads the runs of sites
+		self.xs, self.ys = np.append(xs[self.order], np.inf), np.append(ys[self.order], np.inf)
+		self.far = len(xs)
+
+	def cells(self, x, y):
+		i = np.clip(((x - self.x0) / self.size).astype(np.int64), 0, self.nx - 1)
+		j = np.clip(((y - self.y0) / self.size).astype(np.int64), 0, self.ny - 1)
+		return i, j
+
+	def nearest(self, x, y, chunk=1 << 10):
+		# queries of a same bucket are searched together, they read the same sites
+		x, y = np.asarray(x, dtype=np.float64).ravel(), np.asarray(y, dtype=np.float64).ravel()
+		i, j = self.cells(x, y)
+		queries = np.argsort(j * self.nx + i, kind="stable")
+		found = np.empty(len(x), dtype=np.int64)
+		for c in range(0, len(x), chunk):
+			q = queries[c:c + chunk]
+			found[q] = self.nearest_chunk(x[q], y[q], i[q], j[q])
+		return self.order[found]
+
+	def nearest_chunk(self, x, y, i, j):
+		# the 3 runs of sites of the rows of buckets around each query, padded to the longest
+		rows = j[:, None] + np.arange(-1, 2)
+		valid = (rows >= 0) & (rows < self.ny)
+		rows = rows.clip(0, self.ny - 1) * self.nx
+		lo = np.where(valid, self.start[rows + np.maximum(i - 1, 0)[:, None]], self.far)
+		hi = np.where(valid, self.start[rows + np.minimum(i + 1, self.nx - 1)[:, None] + 1], self.far)
+		index = lo[:, :, None] + np.arange(max(1, (hi - lo).max()))
+		index[index >= hi[:, :, None]] = self.far
+		index = index.reshape(len(x), -1)
+		d = (self.xs[index] - x[:, None]) ** 2
+		d += (self.ys[index] - y[:, None]) ** 2
+		arg = d.argmin(axis=1)
+		best = d[np.arange(len(x)), arg]
+		found = index[np.arange(len(x)), arg]
+
+		# a query is done when sites out of the 9 buckets are farther, past a side still in the grid
+		bound = np.full(len(x), np.inf)
+		for beyond, side in [(i > 1, x - (self.x0 + (i - 1) * self.size)),
+		                     (i < self.nx - 2, self.x0 + (i + 2) * self.size - x),
+		                     (j > 1, y - (self.y0 + (j - 1) * self.size)),
+		                     (j < self.ny - 2, self.y0 + (j + 2) * self.size - y)]:
+			bound = np.where(beyond, np.minimum(bound, np.maximum(side, 0) ** 2), bound)
+		query = np.nonzero(best > bound)[0]
+		if len(query):
+			self.descend(x, y, query, best, found)
+		return found
+
+	def descend(self, x, y, query, best, found):
+		# each pair of a query and a block is kept while the block can hold a nearer site,
+		# the farthest corner of a block bounds the distance to its nearest site
+		limit = best.copy()
+		node = np.zeros(len(query), dtype=np.int64)
+		for level in range(len(self.levels) - 1, -1, -1):
+			boxes = self.levels[level].reshape(4, -1)
+			qx, qy = x[query], y[query]
+			bx0, by0, bx1, by1 = boxes[:, node]
+			low = np.maximum(0, np.maximum(bx0 - qx, qx - bx1)) ** 2 + np.maximum(0, np.maximum(by0 - qy, qy - by1)) ** 2
+			high = np.maximum(np.abs(qx - bx0), np.abs(qx - bx1)) ** 2 + np.maximum(np.abs(qy - by0), np.abs(qy - by1)) ** 2
+			np.minimum.at(limit, query, high)
+			keep = low <= limit[query]
+			query, node = query[keep], node[keep]
+			if level == 0:
+				break
+
+			# children of a block in the level below
+			_, ny, nx = self.levels[level - 1].shape
+			width = self.levels[level].shape[2]
+			ci, cj = 2 * (node % width), 2 * (node // width)
+			ci = ci[:, None] + np.array([0, 1, 0, 1])
+			cj = cj[:, None] + np.array([0, 0, 1, 1])
+			valid = (ci < nx) & (cj < ny)
+			query = np.repeat(query, valid.sum(axis=1))
+			node = (cj * nx + ci)[valid]
+
+		# sites of the buckets left
+		counts = self.start[node + 1] - self.start[node]
+		ends = np.cumsum(counts)
+		site = np.repeat(self.start[node], counts) + np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - counts, counts)
+		query = np.repeat(query, counts)
+		d = (self.xs[site] - x[query]) ** 2 + (self.ys[site] - y[query]) ** 2
+		np.minimum.at(best, query, d)
+		nearest = d == best[query]
+		found[query[nearest]] = site[nearest]
+
 class VoronoiGenerator:
-	def __init__(self, fps, width, height, color, stroke_width, nb_pts, duration, line, dasharray, dp, seed=None):
-		set_seed(seed)
+	def __init__(self, fps, width, height, color, stroke_width, nb_pts, duration, line, dasharray, dp, seed=None, points=None,
+	             workers=1, generator="random", distribution="uniform", spacing=0):
 
 		self.dp = dp
 		self.fps = fps
+		self.workers = workers or os.cpu_count()
 		self.width, self.height = width, height
 		self.color = color
 		self.stroke_width = stroke_width
-		self.bounds = Rectangle(Point(0, 0), width, height)
 		self.duration = duration * fps
 		self.dasharray = dasharray
 		self.last_frame = -1
 
 		self.output = []  # list of line segment
-		self.arc = None  # binary tree for parabola arcs
-
-		self.voronoi_points = []
-		for _ in range(nb_pts):
-			pt = Point(randint(0, width), randint(0, height))
-			pt.set_style(fill_color=self.color, stroke_width=0)
-			self.voronoi_points.append(pt)
-		self.line = Line(width, height) if line else None
+		self.appended = []  # segments starting at the left of the box
+		self.arc = None  # first parabola arc of the beachline
+		self.beachline = Beachline()  # balanced tree for parabola arcs
+
+		if points is None:
+			points = generate_sites(nb_pts, width, height, seed, generator, distribution, spacing)
+		# sites are a (n, 2) array, or vertices the sweep gives back in arcs and triangles
+		self.sites = points if isinstance(points, np.ndarray) else \
+			np.array([(point.x, point.y) for point in points], dtype=np.float64).reshape(-1, 2)
+		self.line = line
+		self.triangles = None  # Delaunay triangles of circle events, only recorded when it's a list
+		self.grid = None  # nearest site index
 
 		# Display
 		self.segments_outputs = []  # list of animate segment
 
-		self.points = PriorityQueue()  # site events
-		self.event = PriorityQueue()  # circle events
-
-		iterator_pts = iter(self.voronoi_points)
-		# bounding box
-		first_pt = next(iterator_pts)
-		self.points.push(first_pt)
-		self.x0, self.y0 = first_pt
-		self.x1, self.y1 = self.x0, self.y0
-
-		# insert points to site event
-		for point in iterator_pts:
-			self.points.push(point)
-			# keep track of bounding box size
-			if point.x < self.x0:
-				self.x0 = point.x
-			elif point.x > self.x1:
-				self.x1 = point.x
-			if point.y < self.y0:
-				self.y0 = point.y
-			elif point.y > self.y1:
-				self.y1 = point.y
+		self.points = SiteQueue(points)  # site events
+		self.event = EventQueue()  # circle events
+
+		# bounding box, sorted sites give x
+		self.x0, self.x1 = self.points.xs[0].item(), self.points.xs[-1].item()
+		self.y0, self.y1 = self.points.ys.min().item(), self.points.ys.max().item()
 
 		# add margins to the bounding box
 		dx = (self.x1 - self.x0 + 1) / 5.0
@@ -208,6 +891,10 @@ class VoronoiGenerator:
 		self.y1 = self.y1 + dy
 
 	def process(self):
+		if self.workers > 1 and len(self.points) >= 64 * self.workers:
+			self.process_strips()
+			return
+
 		while not self.points.empty():
 			if not self.event.empty() and (self.event.top().x <= self.points.top().x):
 				self.process_event()  # handle circle event
@@ -220,10 +907,60 @@ class VoronoiGenerator:
 			self.process_event()
 
 		self.finish_edges()
-		if self.line:
-			self.line.compute_line(self.last_frame, self.width)
-			# Add an extra translation to make disappear the bar
-			self.line.line.add_translation(self.last_frame + self.fps, 20, 0)
+
+	def process_strips(self):
+		# The sites are cut in vertical strips of the same size swept in parallel with a halo
+		# of sites on each side. A strip owns the edges which start in it, and keeps them only
+		# if they are right. Sites near the border have wide empty circles, they are swept
+		# together in one more job. All edges must join with the degree of their endpoints
+		# in the sweeps or halos are doubled.
+		xs, ys = self.points.xs, self.points.ys
+		n = len(self.points)
+		cuts = xs[np.linspace(0, n, self.workers + 1).astype(np.int64)[1:-1]].tolist()
+		starts, ends = [-np.inf] + cuts, cuts + [np.inf]
+		bbox = (self.x0, self.y0, self.x1, self.y1)
+		outline = skyline(xs, ys)
+		x0, y0, x1, y1 = xs[0], ys.min(), xs[-1], ys.max()
+		halo = 4 * math.sqrt((x1 - x0 + 1) * (y1 - y0 + 1) / n)
+
+		merged = None
+		with ProcessPoolExecutor(self.workers) as pool:
+			while 4 * halo < min(x1 - x0, y1 - y0):
+				jobs = []
+				for start, end in zip(starts, ends):
+					lo, hi = start - halo, end + halo
+					index = np.arange(np.searchsorted(xs, lo, side="left"), np.searchsorted(xs, hi, side="right"))
+					boxes = [(x0, y0, lo, y1), (hi, y0, x1, y1)]
+					jobs.append(pool.submit(sweep_sites, outline, index, bbox, start, end, boxes))
+				border = np.nonzero((xs < x0 + halo) | (xs > x1 - halo) | (ys < y0 + halo) | (ys > y1 - halo))[0]
+				boxes = [(x0 + halo, y0 + halo, x1 - halo, y1 - halo)]
+				jobs.append(pool.submit(sweep_sites, outline, border, bbox, -np.inf, np.inf, boxes, halo / 2))
+				edges, owners, degrees = (np.concatenate(parts) for parts in zip(*(job.result() for job in jobs)))
+
+				# edges of the border sweep can be found by a strip too
+				_, first = np.unique(np.column_stack([edges, owners]), axis=0, return_index=True)
+				edges, owners, degrees = edges[first], owners[first], degrees[first]
+				_, inverse, counts = np.unique(edges.reshape(-1, 2), axis=0, return_inverse=True, return_counts=True)
+				if len(edges) and (counts[inverse.ravel()] == degrees.ravel()).all():
+					merged = edges, owners
+					break
+				halo *= 2
+
+		if merged is None:
+			# halos cover most of the sites, a single sweep is as fast
+			self.workers = 1
+			self.process()
+			return
+
+		# the arc list of the sweep isn't needed anymore, only the edges are rebuilt
+		edges, owners = merged
+		self.points.fill(n)
+		sites = self.points.pq
+		for (x0, y0, x1, y1), (p0, p1) in zip(edges.tolist(), owners.tolist()):
+			seg = Segment(Vertex(x0, y0), sites[p0], sites[p1])
+			seg.finish(Vertex(x1, y1))
+			self.output.append(seg)
+		self.points.index = n
 
 	def process_point(self):
 		# get next event from site pq
@@ -236,12 +973,15 @@ class VoronoiGenerator:
 		e = self.event.pop()
 
 		if e.valid:
-			# start new edge
-			s = Segment(e.p, self)
+			# start new edge between the neighbours of the removed arc
+			a = e.a
+			s = Segment(e.p, a.pprev.p, a.pnext.p)
 			self.output.append(s)
 
 			# remove associated arc (parabola)
-			a = e.a
+			if self.triangles is not None:
+				self.triangles.append((a.pprev.p, a.p, a.pnext.p))
+			self.beachline.remove(a)
 			if a.pprev is not None:
 				a.pprev.pnext = a.pnext
 				a.pprev.s1 = s
@@ -264,34 +1004,34 @@ class VoronoiGenerator:
 	def arc_insert(self, p):
 		if self.arc is None:
 			self.arc = Arc(p)
+			self.beachline.insert_first(self.arc)
 			# self.arcs_output.append(A(None, None, None))
 		else:
 			# find the current arcs at p.y
-			i = self.arc
+			i = self.beachline.find(p.y, self.breakpoint, 1.0 * p.x)
 			while i is not None:
 				flag, z = self.intersect(p, i)
 				if flag:
-					# new parabola intersects arc i
-					flag, zz = self.intersect(p, i.pnext)
-					if (i.pnext is not None) and (not flag):
-						i.pnext.pprev = Arc(i.p, i, i.pnext)
-						i.pnext = i.pnext.pprev
-					else:
-						i.pnext = Arc(i.p, i)
+					# new parabola intersects arc i, duplicate i after it
+					i.pnext = Arc(i.p, i, i.pnext)
+					if i.pnext.pnext is not None:
+						i.pnext.pnext.pprev = i.pnext
+					self.beachline.insert_after(i, i.pnext)
 					i.pnext.s1 = i.s1
 
 					# add p between i and i.pnext
 					i.pnext.pprev = Arc(p, i, i.pnext)
 					i.pnext = i.pnext.pprev
+					self.beachline.insert_after(i, i.pnext)
 
 					i = i.pnext  # now i points to the new arc
 
 					# add new half-edges connected to i's endpoints
-					seg = Segment(z, self)
+					seg = Segment(z, i.pprev.p, p)
 					self.output.append(seg)
 					i.pprev.s1 = i.s0 = seg
 
-					seg = Segment(z, self)
+					seg = Segment(z, p, i.pnext.p)
 					self.output.append(seg)
 					i.pnext.s0 = i.s1 = seg
 
@@ -302,27 +1042,30 @@ class VoronoiGenerator:
 
 					return
 
+				# only arcs sharing the breakpoint at p.y can still match
+				if i.pnext is None or self.breakpoint(i.p, i.pnext.p, 1.0 * p.x) > p.y:
+					break
 				i = i.pnext
 
 			# if p never intersects an arc, append it to the list
-			i = self.arc
-			while i.pnext is not None:
-				i = i.pnext
+			i = self.beachline.last()
 			i.pnext = Arc(p, i)
+			self.beachline.insert_after(i, i.pnext)
 
 			# insert new segment between p and i
 			x = self.x0
 			y = (i.pnext.p.y + i.p.y) / 2.0
-			start = Point(x, y)
+			start = Vertex(x, y)
 
-			seg = Segment(start, self)
+			seg = Segment(start, i.p, p)
 			i.s1 = i.pnext.s0 = seg
 			self.output.append(seg)
+			self.appended.append(seg)
 
 	def check_circle_event(self, i):
 		# look for a new circle event for arc i
 		if (i.e is not None) and (i.e.x != self.x0):
-			i.e.valid = False
+			self.event.invalidate(i.e)
 		i.e = None
 
 		if (i.pprev is None) or (i.pnext is None):
@@ -356,7 +1099,7 @@ class VoronoiGenerator:
 
 		# o.x plus radius equals max x coord
 		x = ox + math.sqrt((a.x - ox) ** 2 + (a.y - oy) ** 2)
-		o = Point(ox, oy)
+		o = Vertex(ox, oy)
 
 		return True, x, o
 
@@ -371,50 +1114,108 @@ class VoronoiGenerator:
 		b = 0.0
 
 		if i.pprev is not None:
-			a = (self.intersection(i.pprev.p, i.p, 1.0 * p.x)).y
+			a = self.breakpoint(i.pprev.p, i.p, 1.0 * p.x)
 		if i.pnext is not None:
-			b = (self.intersection(i.p, i.pnext.p, 1.0 * p.x)).y
+			b = self.breakpoint(i.p, i.pnext.p, 1.0 * p.x)
 
 		if ((i.pprev is None) or (a <= p.y)) and ((i.pnext is None) or (p.y <= b)):
 			py = p.y
 			px = 1.0 * (i.p.x ** 2 + (i.p.y - py) ** 2 - p.x ** 2) / (2 * i.p.x - 2 * p.x)
-			res = Point(px, py)
+			res = Vertex(px, py)
 			return True, res
 		return False, None
 
-	def intersection(self, p0, p1, l):
-		# get the intersection of two parabolas
-		p = p0
+	def breakpoint(self, p0, p1, l):
+		# get the y coordinate of the intersection of two parabolas
 		if p0.x == p1.x:
-			py = (p0.y + p1.y) / 2.0
+			return (p0.y + p1.y) / 2.0
 		elif p1.x == l:
-			py = p1.y
+			return p1.y
 		elif p0.x == l:
-			py = p0.y
-			p = p1
-		else:
-			# use quadratic formula
-			z0 = 2.0 * (p0.x - l)
-			z1 = 2.0 * (p1.x - l)
+			return p0.y
 
-			a = 1.0 / z0 - 1.0 / z1
-			b = -2.0 * (p0.y / z0 - p1.y / z1)
-			c = 1.0 * (p0.y ** 2 + p0.x ** 2 - l ** 2) / z0 - 1.0 * (p1.y ** 2 + p1.x ** 2 - l ** 2) / z1
+		# use quadratic formula
+		z0 = 2.0 * (p0.x - l)
+		z1 = 2.0 * (p1.x - l)
 
-			py = 1.0 * (-b - math.sqrt(b * b - 4 * a * c)) / (2 * a)
+		a = 1.0 / z0 - 1.0 / z1
+		b = -2.0 * (p0.y / z0 - p1.y / z1)
+		c = 1.0 * (p0.y ** 2 + p0.x ** 2 - l ** 2) / z0 - 1.0 * (p1.y ** 2 + p1.x ** 2 - l ** 2) / z1
 
+		# rounding of nearly co-circular sites can give a discriminant slightly below 0
+		return 1.0 * (-b - math.sqrt(max(0.0, b * b - 4 * a * c))) / (2 * a)
+
+	def intersection(self, p0, p1, l):
+		# get the intersection of two parabolas
+		py = self.breakpoint(p0, p1, l)
+		p = p1 if p0.x == l and p1.x != l else p0
 		px = 1.0 * (p.x ** 2 + (p.y - py) ** 2 - l ** 2) / (2 * p.x - 2 * l)
-		return Point(px, py)
+		return Vertex(px, py)
 
 	def finish_edges(self):
 		l = self.x1 + (self.x1 - self.x0) + (self.y1 - self.y0)
 		i = self.arc
 		while i.pnext is not None:
 			if i.s1 is not None:
-				p = self.intersection(i.p, i.pnext.p, l * 2.0)
+				# the sweep line must be past the start of the edge, circles of almost aligned sites end far away
+				start = i.s1.start
+				reach = start.x + math.hypot(start.x - i.p.x, start.y - i.p.y) + (self.x1 - self.x0) + (self.y1 - self.y0)
+				p = self.intersection(i.p, i.pnext.p, max(l * 2.0, reach))
 				i.s1.finish(p)
 			i = i.pnext
 
+		# edges of the first sites on a same x come from far left, they can end left of the box
+		for seg in self.appended:
+			if seg.end.x < seg.start.x:
+				seg.start = Vertex(seg.end.x - (self.x1 - self.x0), seg.start.y)
+
+	def clip_segments(self):
+		# Put all finished edges in arrays, reorient them from left to right
+		edges = np.array([(o.start.x, o.start.y, o.end.x, o.end.y) for o in self.output], dtype=np.float64).reshape(-1, 4)
+		edges = np.round(edges, 3)
+		swap = (edges[:, 0] > edges[:, 2]) | ((edges[:, 0] == edges[:, 2]) & (edges[:, 1] > edges[:, 3]))
+		edges[swap] = edges[swap][:, [2, 3, 0, 1]]
+
+		# Crop segments to map size with Liang-Barsky
+		keep, t0, t1 = liang_barsky(edges, self.width, self.height)
+		x0, y0 = edges[keep, 0], edges[keep, 1]
+		dx, dy = edges[keep, 2] - x0, edges[keep, 3] - y0
+		t0, t1 = t0[keep], t1[keep]
+		clipped = np.column_stack([x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy])
+		# Only cropped endpoints are rounded again
+		clipped[:, :2] = np.where((t0 > 0)[:, None], np.round(clipped[:, :2], 3), edges[keep][:, :2])
+		clipped[:, 2:] = np.where((t1 < 1)[:, None], np.round(clipped[:, 2:], 3), edges[keep][:, 2:])
+
+		# Frames where the sweep line reaches each endpoint
+		start_frames = (clipped[:, 0] / self.width * self.duration).astype(np.int64)
+		end_frames = (clipped[:, 2] / self.width * self.duration).astype(np.int64)
+		return clipped, start_frames, end_frames
+
+	def compute_segment(self, x0, y0, x1, y1, start_frame, end_frame):
+		start, end = Point(x0, y0), Point(x1, y1)
+		if start_frame != end_frame:
+			# Draw segment by inflation
+			segment = S(start, start)
+			segment.set_style(stroke_color=self.color, stroke_dasharray=self.dasharray)
+			segment.animations.add_animation(start_frame, AnimationType.INFLATION, value=Point(0, 0))
+			segment.animations.add_animation(end_frame, AnimationType.INFLATION, value=end - start)
+		else:
+			# Draw segment by pop
+			segment = S(start, end, opacity=0)
+			segment.set_style(stroke_color="blue")
+			segment.add_opacity(start_frame - 1 if start_frame > 0 else 0, 0)
+			segment.add_opacity(end_frame, 1)
+
+		return segment
+
+	def get_points(self):
+		points = []
+		for x, y in self.sites.tolist():
+			pt = Point(x, y)
+			pt.set_style(fill_color=self.color, stroke_width=0)
+			points.append(pt)
+		return points
+
 	def save_animation(self, name, ext):
 		svg = SVG(width=self.width, height=self.height)
 		# Border
@@ -422,41 +1223,395 @@ class VoronoiGenerator:
 		r.set_style(stroke_color="black", stroke_width=5, fill_color="none")
 		svg.append(r)
 
+		# Animations are only built for segments that stay in the map after crop
+		edges, start_frames, end_frames = self.clip_segments()
+		moving = start_frames != end_frames
+		self.last_frame = int(end_frames[moving].max()) if moving.any() else -1
+		segments = [self.compute_segment(*edge, start_frame, end_frame)
+		            for edge, start_frame, end_frame in zip(edges.tolist(), start_frames.tolist(), end_frames.tolist())]
+
 		if self.line:
-			svg.append(self.line.get_line())
+			line = Line(self.width, self.height)
+			line.compute_line(self.last_frame, self.width)
+			# Add an extra translation to make disappear the bar
+			line.line.add_translation(self.last_frame + self.fps, 20, 0)
+			svg.append(line.get_line())
 
-		for out in self.output:
-			segment = out.get_segment()
-			if self.bounds.is_in(segment.endpoints[0]) and self.bounds.is_in(segment.endpoints[1]):
-				svg.append(segment)
+		svg.append(segments)
 
 		if self.dp:
-			svg.append(self.voronoi_points)
+			svg.append(self.get_points())
 
 		svg.set_view_box(Point(0, 0), Point(self.width, self.height))
 		Video(svg, fps=self.fps).save_movie(name=name, ext=ext)
 
-	def save_frame(self, name, ext):
+	def save_kinetic(self, name, ext, amplitude, share):
 		svg = SVG(width=self.width, height=self.height)
+		kinetic = KineticVoronoi(self, amplitude, share)
+		KineticVideo(svg, kinetic, self.width, self.height, self.fps).save_movie(name=name, ext=ext)
+
+	def compute_labels(self):
+		# Jump flooding, each pixel keeps the nearest site seen among its 9 neighbours at distance step
+		sx = self.sites[:, 0].astype(np.float32)
+		sy = self.sites[:, 1].astype(np.float32)
+		width, height = int(self.width), int(self.height)
+
+		# each site is seeded on its pixel, of sites on the same pixel the lowest index keeps it
+		# and the others get no cell in pixels
+		seeds = np.full((height, width), -1, dtype=np.int32)
+		px = np.clip(sx.astype(np.int64), 0, width - 1)
+		py = np.clip(sy.astype(np.int64), 0, height - 1)
+		pixels, first = np.unique(py * width + px, return_index=True)
+		seeds.reshape(-1)[pixels] = first
+
+		# coordinates of the nearest site of each pixel packed as x + iy, only one masked copy by offset
+		nearest = np.full((height, width), np.inf, dtype=np.complex64)
+		seeded = seeds >= 0
+		nearest[seeded] = sx[seeds[seeded]] + 1j * sy[seeds[seeded]]
+
+		# distance between pixel centers and their site
+		xs = np.arange(width, dtype=np.float32) + 0.5
+		ys = np.arange(height, dtype=np.float32)[:, None] + 0.5
+		best = (xs - nearest.real) ** 2 + (ys - nearest.imag) ** 2
+
+		# pixels are updated by bands of rows small enough to stay in cache
+		band = max(1, (1 << 16) // width)
+		d = np.empty((band, width), dtype=np.float32)
+		t = np.empty((band, width), dtype=np.float32)
+		closer = np.empty((band, width), dtype=bool)
+		candidates = np.empty((band, width), dtype=np.complex64)
+
+		step = 1 << max(0, (max(width, height) - 1).bit_length() - 1)
+		steps = []
+		while step >= 1:
+			steps.append(step)
+			step //= 2
+		for step in steps + [1]:  # an extra pass at 1 fixes most of jump flooding errors
+			for dy in (-step, 0, step):
+				for dx in (-step, 0, step):
+					if (dx == 0 and dy == 0) or abs(dx) >= width or abs(dy) >= height:
+						continue
+					# pixels at (x, y) look at the site of the pixel at (x + dx, y + dy)
+					dst_x = slice(max(0, -dx), width - max(0, dx))
+					src_x = slice(max(0, dx), width - max(0, -dx))
+					pixels_x = xs[dst_x]
+					n = width - abs(dx)
+					for y in range(max(0, -dy), height - max(0, dy), band):
+						rows = min(band, height - max(0, dy) - y)
+						dst = slice(y, y + rows), dst_x
+						src = slice(y + dy, y + dy + rows), src_x
+						# src and dst can overlap, copy sites first
+						c, dd, tt, cl = candidates[:rows, :n], d[:rows, :n], t[:rows, :n], closer[:rows, :n]
+						np.copyto(c, nearest[src])
+
+						np.subtract(pixels_x, c.real, out=dd)
+						np.square(dd, out=dd)
+						np.subtract(ys[dst[0]], c.imag, out=tt)
+						np.square(tt, out=tt)
+						np.add(dd, tt, out=dd)
+						np.less(dd, best[dst], out=cl)
+
+						np.copyto(nearest[dst], c, where=cl)
+						np.minimum(best[dst], dd, out=best[dst])
+
+		# the coordinates of a site lead back to its seed pixel
+		return seeds[np.clip(nearest.imag.astype(np.int64), 0, height - 1), np.clip(nearest.real.astype(np.int64), 0, width - 1)]
+
+	def save_raster(self, name):
+		# Draw directly pixels of the diagram without sweep nor svg
+		labels = self.compute_labels()
+		height, width = labels.shape
+
+		# edges are where the nearest site changes
+		edges = (labels != shift(labels, 1, 0, -2)) & (shift(labels, 1, 0, -2) != -2)
+		edges |= (labels != shift(labels, 0, 1, -2)) & (shift(labels, 0, 1, -2) != -2)
+		for _ in range(max(0, int(self.stroke_width) - 1)):
+			edges |= shift(edges, -1, 0, False) | shift(edges, 0, -1, False)
+
+		pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+		color = parse_color(self.color)
+		pixels[edges] = color
+
+		if self.dp:
+			sites = np.zeros((height, width), dtype=bool)
+			px = np.clip(self.sites[:, 0].astype(np.int64), 0, width - 1)
+			py = np.clip(self.sites[:, 1].astype(np.int64), 0, height - 1)
+			sites[py, px] = True
+			for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+				sites |= shift(sites, dx, dy, False)
+			pixels[sites] = color
+
+		# Border, half of the stroke of the svg rectangle is inside the picture
+		border = 2
+		pixels[:border] = pixels[-border:] = 0
+		pixels[:, :border] = pixels[:, -border:] = 0
+
+		write_png(f"{name}.png", pixels)
+
+	def save_frame(self, name, ext, background="white"):
+		if ext == "png":
+			text = io.StringIO()
+			self.write_svg(text, background)
+			save(text.getvalue(), name, ext)
+			return
+
+		# svg is written while edges are formatted, svgz through gzip
+		with (gzip.open(f"{name}.{ext}", "wt") if ext == "svgz" else open(f"{name}.{ext}", "w")) as f:
+			self.write_svg(f, background)
+
+	def write_svg(self, f, background="white", chunk=1 << 14):
+		# Each style is one path, its data is written by chunks of edges cropped to the map.
+		# background is the default of SVG frames, none or None for a transparent one
+		w, h = self.width, self.height
+		f.write(f'<svg width="{w}" height="{h}" viewBox="0 0 {w} {h}" xmlns="http://www.w3.org/2000/svg">\n')
+		if background and background != "none":
+			f.write(f'<rect x="0" y="0" width="{w}" height="{h}" fill="{background}"/>\n')
 		# Border
-		r = Rectangle(Point(0, 0), self.width, self.height)
-		r.set_style(stroke_color="black", stroke_width=5, fill_color="none")
-		svg.append(r)
+		f.write(f'<path d="M0 0H{w}V{h}H0Z" fill="none" stroke="black" stroke-width="5"/>\n')
+
+		dash = f' stroke-dasharray="{self.dasharray}"' if self.dasharray else ""
+		f.write(f'<path fill="none" stroke="{self.color}" stroke-width="{self.stroke_width}"{dash} d="')
+		for i in range(0, len(self.output), chunk):
+			edges = np.array([(o.start.x, o.start.y, o.end.x, o.end.y) for o in self.output[i:i + chunk]],
+			                 dtype=np.float64).reshape(-1, 4)
+			keep, t0, t1 = liang_barsky(edges, w, h)
+			x0, y0 = edges[keep, 0], edges[keep, 1]
+			dx, dy = edges[keep, 2] - x0, edges[keep, 3] - y0
+			t0, t1 = t0[keep], t1[keep]
+			edges = np.round(np.column_stack([x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy]), 3)
+			f.write("".join(f"M{x0} {y0}L{x1} {y1}" for x0, y0, x1, y1 in edges.tolist()))
+		f.write('"/>\n')
 
-		svg.append(self.get_frame())
-		svg.set_view_box(Point(0, 0), Point(self.width, self.height))
-		save(svg.get_svg(), name, ext)
+		if self.dp:
+			# dots of radius 1 drawn by two half circles
+			f.write(f'<path fill="{self.color}" stroke-width="0" d="')
+			for i in range(0, len(self.sites), chunk):
+				f.write("".join(f"M{x - 1} {y}a1 1 0 1 0 2 0a1 1 0 1 0-2 0"
+				                for x, y in self.sites[i:i + chunk].tolist()))
+			f.write('"/>\n')
+		f.write("</svg>\n")
 
 	def get_frame(self):
 		elements = []
 		for o in self.output:
-			segment = S(Point(o.start.x, o.start.y), Point(o.end.x, o.end.y))
+			segment = S(Point(round(o.start.x, 3), round(o.start.y, 3)), Point(round(o.end.x, 3), round(o.end.y, 3)))
 			segment.set_style(stroke_color=self.color, stroke_width=self.stroke_width, stroke_dasharray=self.dasharray)
 			elements.append(segment)
 		if self.dp:
-			elements.extend(self.voronoi_points)
+			elements.extend(self.get_points())
 		return elements
 
+	def get_topology(self):
+		# cells and Delaunay graph of the processed diagram
+		return Topology(self)
+
+	def locate(self, x, y):
+		# index of the cell of each point in the sorted sites, the grid is built on first call
+		if self.grid is None:
+			self.grid = SiteGrid(self.points.xs, self.points.ys)
+		return self.grid.nearest(x, y)
+
+class KineticVoronoi:
+	# Delaunay triangulation of moving sites, the diagram is its dual. The sweep
+	# only gives the first triangulation, then at each frame the sites move and
+	# only edges around moving sites are checked and flipped back to Delaunay.
+	# Four fixed far corners keep the hull constant, their cells are out of the map.
+	def __init__(self, vg, amplitude, share):
+		self.vg = vg
+		self.frames = max(1, vg.duration)
+		sites = list(dict.fromkeys(map(tuple, vg.sites.tolist())))  # drop duplicates
+		self.nb_sites = len(sites)
+		margin = 10 * (vg.width + vg.height) + amplitude
+		corners = [(-margin, -margin), (vg.width + margin, -margin),
+		           (vg.width + margin, vg.height + margin), (-margin, vg.height + margin)]
+		rest = np.array(sites + corners, dtype=np.float64)
+		self.rest_x, self.rest_y = rest[:, 0], rest[:, 1]
+		self.x, self.y = self.rest_x.copy(), self.rest_y.copy()
+
+		# each moving site loops on a circle through its rest position
+		self.moving = np.array([random() < share for _ in sites] + [False] * 4)
+		self.radius = np.array([uniform(0.2, 1) * amplitude for _ in sites] + [0] * 4) * self.moving
+		self.phase = np.array([uniform(0, 2 * math.pi) for _ in sites] + [0] * 4)
+		self.turns = np.array([choice((-2, -1, 1, 2)) for _ in sites] + [0] * 4)
+
+		self.flips = 0
+		self.rebuilds = 0
+		self.triangulate()
+
+	def triangulate(self):
+		# triangles are the circle events of a sweep over current positions
+		vertices = [Vertex(x, y) for x, y in zip(self.x.tolist(), self.y.tolist())]
+		vg = VoronoiGenerator(self.vg.fps, self.vg.width, self.vg.height, self.vg.color, self.vg.stroke_width,
+		                      len(vertices), 0, False, None, False, points=vertices)
+		vg.triangles = []
+		vg.process()
+		index = {id(vertex): i for i, vertex in enumerate(vertices)}
+		tv = np.array([[index[id(p)] for p in triangle] for triangle in vg.triangles], dtype=np.int64).reshape(-1, 3)
+
+		# sweep gives clockwise triangles, keep them counterclockwise
+		x, y = self.x[tv], self.y[tv]
+		cw = orientation(x[:, 0], y[:, 0], x[:, 1], y[:, 1], x[:, 2], y[:, 2]) < 0
+		tv[cw] = tv[cw][:, [0, 2, 1]]
+		self.tv = tv
+		self.link()
+		self.cx, self.cy = np.empty(len(tv)), np.empty(len(tv))
+		self.update_centers(np.arange(len(tv)))
+		self.rebuilds += 1
+
+	def link(self):
+		# tn[t, k] is the triangle across the edge opposite to corner k of t, -1 on the hull
+		n = len(self.x)
+		a, b = self.tv[:, [1, 2, 0]].ravel(), self.tv[:, [2, 0, 1]].ravel()
+		keys = a * n + b
+		order = np.argsort(keys)
+		twins = b * n + a
+		found = np.searchsorted(keys, twins, sorter=order).clip(max=len(keys) - 1)
+		match = keys[order[found]] == twins
+		self.tn = np.where(match, order[found] // 3, -1).reshape(-1, 3)
+		self.pairs = None
+
+	def update_centers(self, triangles):
+		x, y = self.x[self.tv[triangles]], self.y[self.tv[triangles]]
+		self.cx[triangles], self.cy[triangles] = circumcenter(x[:, 0], y[:, 0], x[:, 1], y[:, 1], x[:, 2], y[:, 2])
+
+	def advance(self, frame):
+		angle = 2 * math.pi * frame / self.frames
+		x = self.rest_x + self.radius * (np.cos(self.phase + self.turns * angle) - np.cos(self.phase))
+		y = self.rest_y + self.radius * (np.sin(self.phase + self.turns * angle) - np.sin(self.phase))
+		self.move(x, y)
+
+	def move(self, x, y, depth=0):
+		previous = self.x, self.y
+		moved = (x != self.x) | (y != self.y)
+		touched = np.nonzero(moved[self.tv].any(axis=1))[0]
+		self.x, self.y = x, y
+		px, py = x[self.tv[touched]], y[self.tv[touched]]
+		folded = orientation(px[:, 0], py[:, 0], px[:, 1], py[:, 1], px[:, 2], py[:, 2]) <= 0
+		if not folded.any():
+			self.repair(touched)
+		elif depth < 8:
+			# sites of folded triangles stop half way, they end their move once the others are repaired
+			late = np.zeros(len(x), dtype=bool)
+			late[self.tv[touched[folded]]] = True
+			late &= moved
+			self.x, self.y = previous
+			self.move(np.where(late, (previous[0] + x) / 2, x), np.where(late, (previous[1] + y) / 2, y), depth + 1)
+			self.move(x, y, depth + 1)
+		else:
+			self.triangulate()
+
+	def repair(self, touched):
+		# Lawson flips, starting with edges of moved triangles which aren't Delaunay anymore
+		t = np.repeat(touched, 3)
+		k = np.tile(np.arange(3), len(touched))
+		u = self.tn[t, k]
+		t, k, u = t[u >= 0], k[u >= 0], u[u >= 0]
+		d = self.tv[u, np.argmax(self.tn[u] == t[:, None], axis=1)]
+		a, b, c = self.tv[t, k], self.tv[t, (k + 1) % 3], self.tv[t, (k + 2) % 3]
+		x, y = self.x, self.y
+		bad = in_circle(x[a], y[a], x[b], y[b], x[c], y[c], x[d], y[d]) > 0
+		if not bad.any():
+			self.update_centers(touched)
+			return
+
+		# few triangles are flipped, they are copied in lists faster to update than arrays
+		stack = list(zip(t[bad].tolist(), k[bad].tolist()))
+		x, y = x.tolist(), y.tolist()
+		tv, tn = {}, {}
+		def fetch(t):
+			if t not in tv:
+				tv[t], tn[t] = self.tv[t].tolist(), self.tn[t].tolist()
+
+		flips = 0
+		budget = 4 * len(self.tv)
+		while stack:
+			t, k = stack.pop()
+			fetch(t)
+			u = tn[t][k]
+			if u < 0:
+				continue
+			fetch(u)
+			a, b, c = tv[t][k], tv[t][(k + 1) % 3], tv[t][(k + 2) % 3]
+			j = tn[u].index(t)
+			d = tv[u][j]
+			if in_circle(x[a], y[a], x[b], y[b], x[c], y[c], x[d], y[d]) <= 0:
+				continue
+			flips += 1
+			if flips > budget:
+				# degenerate positions can flip forever
+				self.triangulate()
+				return
+			for n in (tn[t][(k + 1) % 3], tn[u][(j + 1) % 3]):
+				if n >= 0:
+					fetch(n)
+			self.flip(tv, tn, t, k, u, j)
+			# new triangles are (a, b, d) and (a, d, c), check the four sides of the quad
+			stack.extend(((t, 0), (t, 2), (u, 0), (u, 1)))
+
+		changed = np.array(list(tv), dtype=np.int64)
+		self.tv[changed] = [tv[t] for t in changed.tolist()]
+		self.tn[changed] = [tn[t] for t in changed.tolist()]
+		self.flips += flips
+		self.pairs = None
+		self.update_centers(np.concatenate([touched, changed]))
+
+	@staticmethod
+	def flip(tv, tn, t, k, u, j):
+		# replace triangles t = (a, b, c) and u = (d, c, b) by (a, b, d) and (a, d, c)
+		a, b, c, d = tv[t][k], tv[t][(k + 1) % 3], tv[t][(k + 2) % 3], tv[u][j]
+		n_ca, n_ab = tn[t][(k + 1) % 3], tn[t][(k + 2) % 3]
+		n_bd, n_dc = tn[u][(j + 1) % 3], tn[u][(j + 2) % 3]
+		tv[t], tn[t] = [a, b, d], [n_bd, u, n_ab]
+		tv[u], tn[u] = [a, d, c], [n_dc, n_ca, t]
+		if n_bd >= 0:
+			tn[n_bd][tn[n_bd].index(u)] = t
+		if n_ca >= 0:
+			tn[n_ca][tn[n_ca].index(t)] = u
+
+	def get_edges(self):
+		# Voronoi edges join circumcenters of adjacent triangles
+		if self.pairs is None:
+			self.pairs = np.nonzero(self.tn > np.arange(len(self.tn))[:, None])
+		t = self.pairs[0]
+		u = self.tn[self.pairs]
+		return np.column_stack([self.cx[t], self.cy[t], self.cx[u], self.cy[u]])
+
+	def get_svg(self):
+		edges = self.get_edges()
+		keep, t0, t1 = liang_barsky(edges, self.vg.width, self.vg.height)
+		edges, t0, t1 = edges[keep], t0[keep, None], t1[keep, None]
+		delta = edges[:, 2:] - edges[:, :2]
+		edges = np.column_stack([edges[:, :2] + t0 * delta, edges[:, :2] + t1 * delta])
+
+		d = " ".join(f"M{x0:.2f} {y0:.2f}L{x1:.2f} {y1:.2f}" for x0, y0, x1, y1 in edges.tolist())
+		dash = f'stroke-dasharray="{self.vg.dasharray}" ' if self.vg.dasharray else ""
+		string = f'<path d="{d}" fill="none" stroke="{self.vg.color}" {dash}stroke-width="{self.vg.stroke_width}" />\n'
+		if self.vg.dp:
+			string += "".join(f'<ellipse cx="{x:.2f}" cy="{y:.2f}" rx="1" ry="1" fill="{self.vg.color}" stroke-width="0" />\n'
+			                  for x, y in zip(self.x[:self.nb_sites].tolist(), self.y[:self.nb_sites].tolist()))
+		return string
+
+class KineticVideo(Video):
+	# Frames are drawn from the kinetic diagram instead of svg animations, the document around it
+	# is written here with the background of svg and a border
+	def __init__(self, svg, kinetic, width, height, fps):
+		super().__init__(svg, width, height, fps)
+		self.kinetic = kinetic
+
+	def make_movie(self, start=None, end=None):
+		# last frame is the first one again, it's left out to loop
+		start_frame = math.ceil(start) * self.fps if start else 0
+		end_frame = math.ceil(end) * self.fps if end else self.kinetic.frames
+		w, h = self.kinetic.vg.width, self.kinetic.vg.height
+		head = f'<svg width="{w}" height="{h}" viewBox="0 0 {w} {h}" xmlns="http://www.w3.org/2000/svg">\n'
+		if self.svg.background_color:
+			head += f'<rect x="0" y="0" width="{w}" height="{h}" fill="{self.svg.background_color}"/>\n'
+		head += f'<path d="M0 0H{w}V{h}H0Z" fill="none" stroke="black" stroke-width="5"/>\n'
+		for i in range(start_frame, end_frame):
+			msg(f"Compute frame {i}", DebugLevel.VERBOSE)
+			self.kinetic.advance(i)
+			yield i, f"{head}{self.kinetic.get_svg()}</svg>\n"
+
 def generate_cli():
 	ap = ArgumentParser(
 			description="Make Voronoi Diagram with animation of creation",
@@ -471,6 +1626,25 @@ def generate_cli():
 	               help="Time in second for the animation. Default 10 seconds.", default=10)
 	g.add_argument("-s", "--seed", metavar="INT", type=int,
 	               help="Seed for initialization of the random number generator for predictable results.", default=None)
+	g.add_argument("-k", "--kinetic", metavar="FLOAT", type=float,
+	               help="Radius in pixel of the loop of moving sites in animation, "
+	                    "the diagram is updated at each frame. Default is 0, no move.", default=0)
+	g.add_argument("-km", "--kinetic-moving", metavar="FLOAT", type=float,
+	               help="Share of sites who move in kinetic animation. Default is 1.", default=1)
+	g.add_argument("-g", "--generator", metavar="STR", type=str,
+	               help="Random generator of sites, numpy draws them all at once. Default is random.",
+	               default="random", choices=["random", "numpy"])
+	g.add_argument("-dist", "--distribution", metavar="STR", type=str,
+	               help="Distribution of sites, poisson keeps them at least spacing apart. Default is uniform.",
+	               default="uniform", choices=["uniform", "poisson"])
+	g.add_argument("-sp", "--spacing", metavar="FLOAT", type=float,
+	               help="Minimal distance between poisson sites, 0 to get about the number of points. Default is 0.",
+	               default=0)
+	g.add_argument("-i", "--input", metavar="FILENAME", type=str,
+	               help="Sites file to use instead of random sites, .npy or raw float64 x, y pairs.", default=None)
+	g.add_argument("-w", "--workers", metavar="INT", type=int,
+	               help="Number of processes who sweep vertical strips of the diagram, 0 for all cores. Default is 1.",
+	               default=1)
 
 	g = ap.add_argument_group("Style")
 	g.add_argument("-l", "--line", metavar="BOOL", type=bool,
@@ -483,6 +1657,9 @@ def generate_cli():
 	               help="The size of stroke of Voronoi segment.", default=1)
 	g.add_argument("-dp", "--display-points", metavar="BOOL", type=bool,
 	               help="If need to display point.", default=True)
+	g.add_argument("-bg", "--background-color", metavar="COLOR", type=str,
+	               help="The background color of svg frames. If you want transparent, use none. Default is white.",
+	               default="white")
 
 	g = ap.add_argument_group("Output")
 	g.add_argument("-wdt", "--width", metavar="INT", type=int, help="Width of output element.",
@@ -494,7 +1671,10 @@ def generate_cli():
 	g.add_argument("-o", "--output", metavar="FILENAME", type=str,
 	               help="Name of output file.", default="Voronoi")
 	g.add_argument("-ext", "--extension", metavar="EXTENSION", type=str,
-	               help="Extension of the output file.", default="gif", choices=["png", "svg", "gif", "mp4"])
+	               help="Extension of the output file.", default="gif", choices=["png", "svg", "svgz", "gif", "mp4"])
+	g.add_argument("-bk", "--backend", metavar="STR", type=str,
+	               help="Renderer of png output, raster computes pixels without sweep and can't draw dashes. "
+	                    "Default is svg.", default="svg", choices=["svg", "raster"])
 
 	g = ap.add_argument_group("Misc")
 	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
@@ -504,15 +1684,28 @@ def generate_cli():
 	return ap
 
 def main():
-	args = generate_cli().parse_args()
+	ap = generate_cli()
+	args = ap.parse_args()
+	if args.backend == "raster" and args.dasharray:
+		ap.error("dasharray needs the svg backend")
+	points = load_sites(args.input) if args.input else None
 	vg = VoronoiGenerator(args.frame_per_seconds, args.width, args.height, args.color, args.stroke_size,
-	                      args.points, args.duration, args.line, args.dasharray, args.display_points, args.seed)
-	vg.process()
+	                      args.points, args.duration, args.line, args.dasharray, args.display_points, args.seed,
+	                      points=points, workers=args.workers, generator=args.generator,
+	                      distribution=args.distribution, spacing=args.spacing)
+	if args.extension == "png" and args.backend == "raster":
+		vg.save_raster(args.output)
+		return
+
+	if args.extension in ["gif", "mp4"] and args.kinetic > 0:
+		vg.save_kinetic(args.output, args.extension, args.kinetic, args.kinetic_moving)
+		return
 
+	vg.process()
 	if args.extension in ["gif", "mp4"]:
 		vg.save_animation(args.output, args.extension)
-	elif args.extension in ["svg", "png"]:
-		vg.save_frame(args.output, args.extension)
+	elif args.extension in ["svg", "svgz", "png"]:
+		vg.save_frame(args.output, args.extension, args.background_color)
 
 if __name__ == '__main__':
 	main()
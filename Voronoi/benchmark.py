@@ -0,0 +1,317 @@
+# Micro benchmarks of Voronoi internals
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+import gc
+import gzip
+import heapq
+import os
+import tempfile
+import tracemalloc
+from itertools import count
+from random import Random
+from time import perf_counter
+from argparse import ArgumentParser
+
+import numpy as np
+
+from SVGVideoMaker import Point2D, Segment as S, Arc as A, SVG
+
+from Voronoi import SiteQueue, EventQueue, Event, Arc, Segment, Vertex, VoronoiGenerator, KineticVoronoi
+# endregion Imports
+
+class Site:
+	# Light site, the queues only need x and y
+	def __init__(self, x, y):
+		self.x = x
+		self.y = y
+
+class LegacyPriorityQueue:
+	# Previous queue of VoronoiGenerator, top() pop and push again the head
+	def __init__(self):
+		self.pq = []
+		self.entry_finder = {}
+		self.counter = count()
+
+	def push(self, item):
+		if item in self.entry_finder:
+			return
+		entry = [item.x, next(self.counter), item]
+		self.entry_finder[item] = entry
+		heapq.heappush(self.pq, entry)
+
+	def invalidate(self, item):
+		item.valid = False
+
+	def pop(self):
+		while self.pq:
+			_, _, item = heapq.heappop(self.pq)
+			if item != 'Removed':
+				del self.entry_finder[item]
+				return item
+		raise KeyError('pop from an empty priority queue')
+
+	def top(self):
+		while self.pq:
+			_, _, item = heapq.heappop(self.pq)
+			if item != 'Removed':
+				del self.entry_finder[item]
+				self.push(item)
+				return item
+		raise KeyError('top from an empty priority queue')
+
+	def empty(self):
+		return not self.pq
+
+def sweep(points, event, rng):
+	# Replay the event pattern of VoronoiGenerator.process : each site pushes two
+	# circle events and invalidate one still pending event of its neighbours.
+	pending = []
+	nb_events = 0
+	while not points.empty():
+		if not event.empty() and event.top().x <= points.top().x:
+			e = event.pop()
+			if not e.valid:
+				continue
+			e.a = True  # processed
+			nb_events += 1
+		else:
+			p = points.pop()
+			nb_events += 1
+			for _ in range(2):
+				e = Event(p.x + rng.uniform(0, 50), p, None)
+				event.push(e)
+				pending.append(e)
+			e = pending.pop(rng.randrange(len(pending)))
+			if e.a is None:
+				event.invalidate(e)
+			if len(pending) > 16:
+				pending.pop(0)
+	while not event.empty():
+		if event.pop().valid:
+			nb_events += 1
+	return nb_events
+
+def bench_queue(nb_pts, seed):
+	sites = Random(seed)
+	points = [Site(sites.uniform(0, 10 ** 6), sites.uniform(0, 10 ** 6)) for _ in range(nb_pts)]
+
+	results = {}
+	for name, queues in [("legacy", lambda: (LegacyPriorityQueue(), LegacyPriorityQueue())),
+	                     ("lazy", lambda: (SiteQueue(points), EventQueue()))]:
+		site_queue, event_queue = queues()
+		if name == "legacy":
+			for point in sorted(points, key=lambda pt: (pt.x, pt.y)):
+				site_queue.push(point)
+		start = perf_counter()
+		nb_events = sweep(site_queue, event_queue, Random(seed))
+		elapsed = perf_counter() - start
+		results[name] = nb_events / elapsed
+		print(f"{name:>8} {nb_pts:>9} sites {nb_events:>9} events {elapsed:8.3f} s {results[name]:12.0f} events/s")
+	print(f"{'speedup':>8} {results['lazy'] / results['legacy']:.2f}x")
+
+def traced_peak(function):
+	tracemalloc.start()
+	start = perf_counter()
+	result = function()
+	elapsed = perf_counter() - start
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return result, peak, elapsed
+
+def bench_memory(nb_pts, seed):
+	# Allocation of one sweep object against the SVG objects it used to be
+	nb = 1000
+	pairs = [
+		("arc", lambda: [A(0, 0, 0) for _ in range(nb)], lambda: [Arc(None) for _ in range(nb)]),
+		("vertex", lambda: [Point2D(0, 0) for _ in range(nb)], lambda: [Vertex(0, 0) for _ in range(nb)]),
+		("segment", lambda: [S(Point2D(0, 0), Point2D(0, 0)) for _ in range(nb)], lambda: [Segment(None) for _ in range(nb)]),
+	]
+	for name, legacy, compact in pairs:
+		_, legacy_peak, _ = traced_peak(legacy)
+		_, compact_peak, _ = traced_peak(compact)
+		print(f"{name:>8} {legacy_peak / nb:8.0f} B svg {compact_peak / nb:8.0f} B slotted {legacy_peak / compact_peak:6.1f}x")
+
+	# Peak of a whole diagram
+	side = 10 * nb_pts
+	def sweep_diagram():
+		vg = VoronoiGenerator(30, side, side, "blue", 1, nb_pts, 10, True, None, True, seed)
+		vg.process()
+		return vg
+	vg, peak, elapsed = traced_peak(sweep_diagram)
+	print(f"{'sweep':>8} {nb_pts:>9} sites {len(vg.output):>9} edges {elapsed:8.3f} s "
+	      f"peak {peak / 2 ** 20:8.1f} MiB {peak / nb_pts:6.0f} B/site")
+
+def bench_kinetic(nb_pts, seed):
+	# First second of a 10 s kinetic animation at 60 fps, flips against a sweep for each frame
+	side = 16 * int(nb_pts ** 0.5)
+	vg = VoronoiGenerator(60, side, side, "blue", 1, nb_pts, 10, False, None, False, seed)
+	kinetic = KineticVoronoi(vg, 30, 1)
+
+	nb_frames = 60
+	start = perf_counter()
+	for frame in range(1, nb_frames + 1):
+		kinetic.advance(frame)
+		kinetic.get_edges()
+	flips = (perf_counter() - start) / nb_frames
+
+	nb = 5
+	start = perf_counter()
+	for _ in range(nb):
+		points = [Vertex(x, y) for x, y in zip(kinetic.x.tolist(), kinetic.y.tolist())]
+		VoronoiGenerator(60, side, side, "blue", 1, nb_pts, 1, False, None, False, points=points).process()
+	sweep = (perf_counter() - start) / nb
+	print(f"{'kinetic':>8} {nb_pts:>9} sites {kinetic.flips / nb_frames:9.0f} flips/frame "
+	      f"{flips * 1000:8.2f} ms/frame sweep {sweep * 1000:8.2f} ms/frame {sweep / flips:6.1f}x")
+
+def bench_drift(nb_pts, seed):
+	# Regression of the re-sweep of drifting sites, nearly co-circular ones gave a negative discriminant
+	# in breakpoint on this map, whatever the number of points asked
+	vg = VoronoiGenerator(30, 500, 500, "blue", 1, 500, 2, False, None, True, 1)
+	kinetic = KineticVoronoi(vg, 80, 0.5)
+	frames = range(0, kinetic.frames, 3)
+	start = perf_counter()
+	for frame in frames:
+		kinetic.advance(frame)
+	elapsed = (perf_counter() - start) / len(frames)
+	print(f"{'drift':>8} {kinetic.nb_sites:>9} sites {kinetic.rebuilds:>9} rebuilds "
+	      f"{elapsed * 1000:8.2f} ms/frame ok")
+
+def bench_strips(nb_pts, seed):
+	# Sweep of vertical strips by 1 to all cores, the diagram must be the one of a single sweep
+	side = 10 * nb_pts
+	reference = None
+	for workers in range(1, os.cpu_count() + 1):
+		vg = VoronoiGenerator(30, side, side, "blue", 1, nb_pts, 10, True, None, True, seed, workers=workers)
+		start = perf_counter()
+		vg.process()
+		elapsed = perf_counter() - start
+		edges = sorted((s.start.x, s.start.y, s.end.x, s.end.y) for s in vg.output)
+		if reference is None:
+			reference = edges, elapsed
+		same = "same" if edges == reference[0] else "DIFFERENT"
+		print(f"{'strips':>8} {nb_pts:>9} sites {workers:>3} workers {elapsed:8.3f} s "
+		      f"{reference[1] / elapsed:6.2f}x {same}")
+
+def bench_svg(nb_pts, seed):
+	# Frame of a diagram as svg elements against the streaming writer, svgz included
+	side = 10 * int(nb_pts ** 0.5)
+	vg = VoronoiGenerator(30, side, side, "blue", 1, nb_pts, 10, True, None, False, seed)
+	vg.process()
+
+	def elements():
+		svg = SVG(width=side, height=side)
+		svg.append(vg.get_frame())
+		svg.set_view_box(Point2D(0, 0), Point2D(side, side))
+		return len(svg.get_svg().encode())
+
+	def stream(opener):
+		with tempfile.TemporaryFile() as raw:
+			with opener(raw) as f:
+				vg.write_svg(f)
+			return raw.tell()
+
+	runs = [("elements", elements),
+	        ("stream", lambda: stream(lambda raw: open(raw.fileno(), "w", closefd=False))),
+	        ("svgz", lambda: stream(lambda raw: gzip.open(raw, "wt")))]
+	for name, run in runs:
+		# tracing slows down allocations, time is taken on another run
+		gc.collect()
+		start = perf_counter()
+		run()
+		elapsed = perf_counter() - start
+		size, peak, _ = traced_peak(run)
+		print(f"{name:>8} {nb_pts:>9} sites {len(vg.output):>9} edges {elapsed:8.3f} s "
+		      f"{size / 2 ** 20:8.2f} MiB file peak {peak / 2 ** 20:8.1f} MiB")
+
+def bench_topology(nb_pts, seed):
+	# Cells and Delaunay graph built from the edges against the sweep giving them
+	side = 10 * int(nb_pts ** 0.5)
+	vg = VoronoiGenerator(30, side, side, "blue", 1, nb_pts, 10, True, None, False, seed, generator="numpy")
+	start = perf_counter()
+	vg.process()
+	sweep = perf_counter() - start
+	start = perf_counter()
+	topology = vg.get_topology()
+	elapsed = perf_counter() - start
+	print(f"{'topology':>8} {nb_pts:>9} sites {len(topology.triangles):>9} triangles sweep {sweep:8.3f} s "
+	      f"topology {elapsed:8.3f} s {elapsed / sweep:6.1%}")
+
+def bench_locate(nb_pts, seed):
+	# Cells of a million points of the map, a sample is checked against all sites
+	side = 10 * int(nb_pts ** 0.5)
+	vg = VoronoiGenerator(30, side, side, "blue", 1, nb_pts, 10, True, None, False, seed, generator="numpy")
+	rng = np.random.default_rng(seed)
+	x, y = rng.uniform(0, side, 10 ** 6), rng.uniform(0, side, 10 ** 6)
+	start = perf_counter()
+	vg.locate(x[:1], y[:1])
+	build = perf_counter() - start
+	start = perf_counter()
+	found = vg.locate(x, y)
+	elapsed = perf_counter() - start
+
+	xs, ys = vg.points.xs, vg.points.ys
+	d = (xs[found[:100]] - x[:100]) ** 2 + (ys[found[:100]] - y[:100]) ** 2
+	brute = ((xs[None, :] - x[:100, None]) ** 2 + (ys[None, :] - y[:100, None]) ** 2).min(axis=1)
+	same = "same" if (d == brute).all() else "DIFFERENT"
+	print(f"{'locate':>8} {nb_pts:>9} sites build {build:8.3f} s {len(x) / elapsed:12.0f} queries/s {same}")
+
+def bench_poisson(nb_pts, seed):
+	# Poisson disk sites against uniform ones, generation and what the sweep does with them
+	side = 10 * int(nb_pts ** 0.5)
+	for distribution in ("uniform", "poisson"):
+		start = perf_counter()
+		vg = VoronoiGenerator(30, side, side, "blue", 1, nb_pts, 10, True, None, False, seed, generator="numpy",
+		                      distribution=distribution)
+		generation = perf_counter() - start
+		start = perf_counter()
+		vg.process()
+		sweep = perf_counter() - start
+		nb_sites = len(vg.sites)
+		print(f"{distribution:>8} {nb_sites:>9} sites generation {generation:8.3f} s sweep {sweep:8.3f} s "
+		      f"{len(vg.output) / nb_sites:5.2f} edges/site {sweep / nb_sites * 1e6:6.2f} us/site")
+
+BENCHMARKS = {
+	"queue": bench_queue,
+	"memory": bench_memory,
+	"kinetic": bench_kinetic,
+	"drift": bench_drift,
+	"strips": bench_strips,
+	"svg": bench_svg,
+	"topology": bench_topology,
+	"locate": bench_locate,
+	"poisson": bench_poisson,
+}
+
+def generate_cli():
+	ap = ArgumentParser(
+			description="Micro benchmarks of Voronoi internals.",
+			epilog="Report bugs, request features, or provide suggestions via https://github.com/evayann/NiceEffects",
+			add_help=False
+	)
+
+	g = ap.add_argument_group("Benchmark")
+	g.add_argument("-b", "--benchmark", metavar="STR", type=str, nargs="+",
+	               help="Benchmarks to run. Default all.", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+	g.add_argument("-nb", "--points", metavar="INT", type=int, nargs="+",
+	               help="Number of points for each run.", default=[10 ** 5, 10 ** 6])
+	g.add_argument("-s", "--seed", metavar="INT", type=int,
+	               help="Seed for initialization of the random number generator for predictable results.", default=0)
+
+	g = ap.add_argument_group("Misc")
+	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
+	               version=f"%(prog)s V.{__version__}")
+	g.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+	return ap
+
+def main():
+	args = generate_cli().parse_args()
+	for name in args.benchmark:
+		for nb_pts in args.points:
+			BENCHMARKS[name](nb_pts, args.seed)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,136 @@
+# Sweep of Voronoi seeds over processes, summaries and thumbnails to choose diagrams to render
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+import os
+import sys
+import json
+from time import perf_counter
+from functools import partial
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Voronoi import VoronoiGenerator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared helpers at the root
+from raster import write_png, thumbnail
+# endregion Imports
+
+def generator(seed, args):
+	# Diagram of a seed with the default style of Voronoi
+	return VoronoiGenerator(args.frame_per_seconds, args.width, args.height, "blue", 1, args.points, args.duration,
+	                        True, None, True, seed, generator=args.generator, distribution=args.distribution,
+	                        spacing=args.spacing)
+
+def summarize(seed, args):
+	# Diagram of a seed with its metrics, cells are the pixels of the raster output, sizes relative to the mean cell
+	vg = generator(seed, args)
+	start = perf_counter()
+	vg.process()
+	sweep = perf_counter() - start
+
+	labels = vg.compute_labels()
+	areas = np.bincount(labels[labels >= 0], minlength=len(vg.sites)) * len(vg.sites) / labels.size
+	neighbours = np.diff(vg.get_topology().neighbour_start)
+	if args.thumbnail_size:
+		write_png(f"{args.output}-{seed}.png", thumbnail(labels, args.thumbnail_size))
+	return {
+		"seed": seed,
+		"sites": len(vg.sites),
+		"edges": len(vg.output),
+		"smallest": float(areas.min()) if len(areas) else 0.0,
+		"largest": float(areas.max()) if len(areas) else 0.0,
+		"spread": float(areas.std()) if len(areas) else 0.0,
+		"neighbours": float(neighbours.mean()) if len(neighbours) else 0.0,
+		"sweep": sweep,
+	}
+
+def render(seed, args):
+	# Full video of a chosen seed, as Voronoi does
+	vg = generator(seed, args)
+	if args.kinetic > 0:
+		vg.save_kinetic(f"{args.output}-{seed}", args.extension, args.kinetic, args.kinetic_moving)
+		return
+	vg.process()
+	vg.save_animation(f"{args.output}-{seed}", args.extension)
+
+def generate_cli():
+	ap = ArgumentParser(
+			description="Make Voronoi seeds in parallel, with metrics and thumbnails to choose the ones to render.",
+			epilog="Report bugs, request features, or provide suggestions via https://github.com/evayann/NiceEffects",
+			add_help=False
+	)
+
+	g = ap.add_argument_group("Generation")
+	g.add_argument("-s", "--seed", metavar="INT", type=int,
+	               help="First seed of the sweep. Default is 0.", default=0)
+	g.add_argument("-c", "--count", metavar="INT", type=int,
+	               help="Number of seeds to make. Default is 16.", default=16)
+	g.add_argument("-nb", "--points", metavar="INT", type=int,
+	               help="Number of points for Voronoi diagram.", default=10)
+	g.add_argument("-g", "--generator", metavar="STR", type=str,
+	               help="Random generator of sites, numpy draws them all at once. Default is random.",
+	               default="random", choices=["random", "numpy"])
+	g.add_argument("-dist", "--distribution", metavar="STR", type=str,
+	               help="Distribution of sites, poisson keeps them at least spacing apart. Default is uniform.",
+	               default="uniform", choices=["uniform", "poisson"])
+	g.add_argument("-sp", "--spacing", metavar="FLOAT", type=float,
+	               help="Minimal distance between poisson sites, 0 to get about the number of points. Default is 0.",
+	               default=0)
+	g.add_argument("-w", "--workers", metavar="INT", type=int,
+	               help="Number of processes who make seeds, 0 for all cores. Default is 0.", default=0)
+
+	g = ap.add_argument_group("Output")
+	g.add_argument("-wdt", "--width", metavar="INT", type=int, help="Width of output element.",
+	               default=500)
+	g.add_argument("-hgt", "--height", metavar="INT", type=int, help="Height of output element.",
+	               default=500)
+	g.add_argument("-o", "--output", metavar="FILENAME", type=str,
+	               help="Prefix of the summary json, thumbnails and videos, followed by the seed.", default="Sweep")
+	g.add_argument("-ts", "--thumbnail-size", metavar="INT", type=int,
+	               help="Largest side in pixel of thumbnails, 0 for none. Default is 128.", default=128)
+	g.add_argument("-r", "--render", metavar="INT", type=int, nargs="+",
+	               help="Seeds to render as videos instead of sweeping.", default=None)
+	g.add_argument("-d", "--duration", metavar="INT", type=int,
+	               help="Time in second for rendered diagrams. Default 10 seconds.", default=10)
+	g.add_argument("-k", "--kinetic", metavar="FLOAT", type=float,
+	               help="Radius in pixel of the loop of moving sites in rendered diagrams. Default is 0, no move.",
+	               default=0)
+	g.add_argument("-km", "--kinetic-moving", metavar="FLOAT", type=float,
+	               help="Share of sites who move in kinetic animation. Default is 1.", default=1)
+	g.add_argument("-fps", "--frame-per-seconds", metavar="INT", type=int,
+	               help="The number of frame per seconds.", default=30)
+	g.add_argument("-ext", "--extension", metavar="EXTENSION", type=str,
+	               help="Extension of rendered videos.", default="gif", choices=["gif", "mp4"])
+
+	g = ap.add_argument_group("Misc")
+	g.add_argument("-v", "--version", action="version", help="Show version number and exit.",
+	               version=f"%(prog)s V.{__version__}")
+	g.add_argument("-h", "--help", action="help", help="Show this help message and exit.")
+
+	return ap
+
+def main():
+	args = generate_cli().parse_args()
+	seeds = args.render or list(range(args.seed, args.seed + args.count))
+	workers = min(args.workers or os.cpu_count(), len(seeds))
+
+	with ProcessPoolExecutor(workers) as pool:
+		if args.render:
+			list(pool.map(partial(render, args=args), seeds))
+			return
+		summaries = list(pool.map(partial(summarize, args=args), seeds))
+
+	with open(f"{args.output}.json", "w") as f:
+		json.dump(summaries, f, indent=1)
+	print(f"{'seed':>8} {'sites':>6} {'smallest':>9} {'largest':>8} {'spread':>7} {'neighbours':>11} {'sweep s':>8}")
+	for summary in summaries:
+		print(f"{summary['seed']:>8} {summary['sites']:>6} {summary['smallest']:>9.2f} {summary['largest']:>8.2f} "
+		      f"{summary['spread']:>7.2f} {summary['neighbours']:>11.2f} {summary['sweep']:>8.3f}")
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,56 @@
+# Helpers shared by the effects that draw their frames in numpy instead of svg
+
+__author__ = "Yann Zavattero"
+__version__ = "1"
+
+# region Imports
+import struct
+import zlib
+
+import numpy as np
+# endregion Imports
+
+# Basic color keywords of SVG, other colors are given in hexadecimal or rgb()
+COLORS = {
+	"black": (0, 0, 0), "silver": (192, 192, 192), "gray": (128, 128, 128), "white": (255, 255, 255),
+	"maroon": (128, 0, 0), "red": (255, 0, 0), "purple": (128, 0, 128), "fuchsia": (255, 0, 255),
+	"green": (0, 128, 0), "lime": (0, 255, 0), "olive": (128, 128, 0), "yellow": (255, 255, 0),
+	"navy": (0, 0, 128), "blue": (0, 0, 255), "teal": (0, 128, 128), "aqua": (0, 255, 255),
+}
+
+def parse_color(color):
+	color = color.strip().lower()
+	if color in COLORS:
+		return COLORS[color]
+	if color.startswith("#") and len(color) == 7:
+		return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+	if color.startswith("rgb(") and color.endswith(")"):
+		color = color[4:-1]
+	try:
+		r, g, b = (int(v) for v in color.split(","))
+	except ValueError:
+		raise ValueError(f"Color {color} isn't supported without svg")
+	return r, g, b
+
+def write_png(path, pixels):
+	# pixels is a (height, width, 3) uint8 array, each row starts with filter type 0
+	def chunk(tag, data):
+		return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+	height, width, _ = pixels.shape
+	raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)], axis=1)
+	with open(path, "wb") as f:
+		f.write(b"\x89PNG\r\n\x1a\n")
+		f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+		f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+		f.write(chunk(b"IEND", b""))
+
+def thumbnail(grid, size):
+	# a color by id of grid, negative ids in white, nearest cell of each pixel for at most size pixels by side
+	scale = size / max(grid.shape)
+	rows = np.minimum((np.arange(max(1, round(grid.shape[0] * scale))) / scale).astype(np.int64), grid.shape[0] - 1)
+	cols = np.minimum((np.arange(max(1, round(grid.shape[1] * scale))) / scale).astype(np.int64), grid.shape[1] - 1)
+	ids = grid[rows[:, None], cols].astype(np.uint32)
+	colors = np.stack([(ids * 2654435761 >> shift) & 0xFF for shift in (8, 16, 24)], axis=-1).astype(np.uint8)
+	colors[grid[rows[:, None], cols] < 0] = 255
+	return colors